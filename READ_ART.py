@@ -1,9 +1,17 @@
 import glob
+import hashlib
+import json
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, \
+    wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 import os
+import shutil
 import stat
 import struct
+import tempfile
 import weakref
+from collections import OrderedDict
 from functools import lru_cache
 from matplotlib import pyplot as plt
 
@@ -12,11 +20,68 @@ from definitions import \
     filename_pattern, \
     dmparticle_header_struct, \
     constants, \
-    seek_extras
+    seek_extras, \
+    endian, \
+    star_struct
 #    nstars, \
 #    path, \
 #    filename
 
+class FieldCache:
+ """
+ LRU cache of particle fields bounded by a byte budget, with hit and
+ miss counters. Cached arrays are shared with callers, who must not
+ modify them in place.
+ """
+ def __init__(self, max_bytes=2**30):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+ def __contains__(self, key):
+        return key in self._data
+
+ def __len__(self):
+        return len(self._data)
+
+ def get(self, key):
+        """
+        Return a cached field (marking it most recently used) and count
+        the lookup as a hit, or return None and count a miss.
+        """
+        if key in self._data:
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+        self.misses += 1
+        return None
+
+ def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+ def __setitem__(self, key, value):
+        if not isinstance(value, np.ndarray):
+            raise TypeError("FieldCache holds numpy arrays, not %s"
+                            % type(value).__name__)
+        if key in self._data:
+            self.nbytes -= self._data.pop(key).nbytes
+        if value.nbytes > self.max_bytes:
+            return
+        self._data[key] = value
+        self.nbytes += value.nbytes
+        while self.nbytes > self.max_bytes:
+            k, v = self._data.popitem(last=False)
+            self.nbytes -= v.nbytes
+
+ def clear(self):
+        self._data.clear()
+        self.nbytes = 0
+
 class ART_INPUT:
  def __init__(self, path, filename, nstars, dataset_type='art',
                  fields=None, storage_filename=None,
@@ -24,9 +89,11 @@ class ART_INPUT:
                  limit_level=None, spread_age=True,
                  force_max_level=None, file_particle_header=None,
                  file_particle_data=None, file_particle_stars=None,
-                 units_override=None):
+                 units_override=None, mmap=False, dtype='f8',
+                 threads=None, cache_bytes=2**30):
         self._fields_in_file = fields
-        self.cache = {}
+        self.cache = FieldCache(cache_bytes)
+        self._stars = None
         self._file_art = filename
         self._file_path = path
         self._file_particle_header = file_particle_header
@@ -41,6 +108,9 @@ class ART_INPUT:
         self.force_max_level = force_max_level
         self.spread_age = spread_age
         self.storage_filename = storage_filename
+        self.mmap = mmap
+        self.dtype = dtype
+        self.threads = threads
 
  def _find_files(self,filename,path):
         """
@@ -90,51 +160,18 @@ class ART_INPUT:
         self.particle_types = []
         self.particle_types_raw = ()
         assert self._file_particle_header
-        with open(self._file_particle_header, "rb") as fh:
-            seek = 4
-            fh.seek(seek)
-            headerstr = np.fromfile(fh, count=1, dtype='<S45')
-            aexpn = np.fromfile(fh, count=1, dtype='<f4')
-            aexp0 = np.fromfile(fh, count=1, dtype='<f4')
-            amplt = np.fromfile(fh, count=1, dtype='<f4')
-            astep = np.fromfile(fh, count=1, dtype='<f4')
-            istep = np.fromfile(fh, count=1, dtype='<i4')
-            partw = np.fromfile(fh, count=1, dtype='<f4')
-            tintg = np.fromfile(fh, count=1, dtype='<f4')
-            ekin = np.fromfile(fh, count=1, dtype='<f4')
-            ekin1 = np.fromfile(fh, count=1, dtype='<f4')
-            ekin2 = np.fromfile(fh, count=1, dtype='<f4')
-            au0 = np.fromfile(fh, count=1, dtype='<f4')
-            aeu0 = np.fromfile(fh, count=1, dtype='<f4')
-            nrowc = np.fromfile(fh, count=1, dtype='<i4')
-            ngridc = np.fromfile(fh, count=1, dtype='<i4')
-            nspecs = np.fromfile(fh, count=1, dtype='<i4')
-            nseed = np.fromfile(fh, count=1, dtype='<i4')
-            Om0 = np.fromfile(fh, count=1, dtype='<f4')
-            Oml0 = np.fromfile(fh, count=1, dtype='<f4')
-            hubble = np.fromfile(fh, count=1, dtype='<f4')
-            Wp5 = np.fromfile(fh, count=1, dtype='<f4')
-            Ocurv = np.fromfile(fh, count=1, dtype='<f4')
-            wspecies = np.fromfile(fh, count=10, dtype='<f4')
-            lspecies = np.fromfile(fh, count=10, dtype='<i4')
-            extras1 = np.fromfile(fh, count=71, dtype='<f4')
-            Rs = np.fromfile(fh, count=1, dtype='<f4')
-            Md = np.fromfile(fh, count=1, dtype='<f4')
-            extras2 = np.fromfile(fh, count=6, dtype='<f4')
-            boxsize = np.fromfile(fh, count=1, dtype='<f4')
-        n = int(nspecs)
+        self.endian = e = detect_endian(self._file_particle_header)
+        hdr = read_header(self._file_particle_header, e)
+        nrowc, nspecs, Rs, Md = [np.atleast_1d(hdr[k])
+                                 for k in ('Nrow', 'Nspecies', 'Rs', 'Md')]
+        wspecies, lspecies = hdr['wspecies'], hdr['lspecies']
+        n = int(nspecs[0])
         particle_header_vals = {}
-        tmp = np.array([headerstr, aexpn, aexp0, amplt, astep, istep,
-            partw, tintg, ekin, ekin1, ekin2, au0, aeu0, nrowc, ngridc,
-            nspecs, nseed, Om0, Oml0, hubble, Wp5, Ocurv, wspecies,
-            lspecies, extras1,Rs,Md,extras2, boxsize])
-        for i in range(len(tmp)):
-            a1 = dmparticle_header_struct[0][i]
-            a2 = dmparticle_header_struct[1][i]
+        for a1, a2 in zip(*dmparticle_header_struct):
             if a2 == 1:
-                particle_header_vals[a1] = tmp[i][0]
+                particle_header_vals[a1] = hdr[a1]
             else:
-                particle_header_vals[a1] = tmp[i][:a2]
+                particle_header_vals[a1] = hdr[a1][:a2]
         for specie in range(n):
             self.particle_types.append("specie%i" % specie)
         self.particle_types_raw = tuple(
@@ -183,29 +220,72 @@ class ART_INPUT:
 #        if self.force_max_level is not None:
 #            self.max_level = self.force_max_level
         self.hubble_time = 1.0/(self.hubble_constant*100/3.08568025e19)
+        self.current_time = a2t(self.parameters["aexpn"], self.omega_matter,
+                                self.omega_lambda, self.hubble_constant)
         self.gamma = self.parameters["gamma"]
         self.ws = self.parameters["wspecies"]
         self.ls = self.parameters["lspecies"]
         self.file_particle = self._file_particle_data
         self.Nrow = self.parameters["Nrow"]
         self.Ngrid = self.parameters["ng"]
- def _get_field(self,  field):
+ def species_mass(self, specie):
+        """
+        Mass of one particle of the given species.
+        """
+        return self.scaleM*2**specie
+ def _components(self, nstars):
+        """
+        The (name, idxa, idxb, mass) particle ranges read_ART splits a
+        snapshot into: the first nstars particles of specie0 are stars,
+        the rest of specie0 and every other species are dark matter.
+        Particle nstars is skipped, as read_ART always has.
+        """
+        edges = np.concatenate(([0], self.ls))
+        comps = [('stars', 0, nstars, self.species_mass(0)),
+                 ('specie0', nstars+1, edges[1], self.species_mass(0))]
+        for i in range(1, len(self.ls)):
+            comps.append(("specie%i" % i, edges[i], edges[i+1],
+                          self.species_mass(i)))
+        return [(name, int(a), int(b), float(np.squeeze(m)))
+                for name, a, b, m in comps]
+ def _get_field(self,  field, raw=None):
+        cached = self.cache.get(field)
+        if cached is not None:
+            return cached
         tr = {}
         ftype, fname = field
+        if ftype == 'stars':
+            # Columns of the stars file, memory-mapped on first use
+            if self._stars is None and self._file_particle_stars \
+                    and not self.skip_stars:
+                self._stars = map_stars(self._file_particle_stars,
+                                        self.endian)
+            tr[field] = np.array([])
+            if self._stars is not None and fname in self._stars:
+                # Header records are scalars; keep fields as arrays
+                tr[field] = np.asanyarray(self._stars[fname])
+            self.cache[field] = tr[field]
+            return tr[field]
         ptmax = self.ws[-1]
         pbool, idxa, idxb = _determine_field_size(self, ftype,
                                                   self.ls, ptmax)
         npa = idxb - idxa
         sizes = np.diff(np.concatenate(([0], self.ls)))
         rp = lambda ax: read_particles(
-            self._file_particle_data, self.Ngrid, idxa=idxa,
-            idxb=idxb, fields=ax)
+            self._file_particle_data, self.Nrow[0], idxa=idxa,
+            idxb=idxb, fields=ax, mmap=self.mmap, endian=self.endian,
+            dtype=self.dtype, threads=self.threads)
+        if raw is not None:
+            # Copy the rows, a cached view would keep the whole block alive
+            rp = lambda ax: [raw[particle_words.index(a)].copy() for a in ax]
         for i, ax in enumerate('xyz'):
             if fname.startswith("particle_position_%s" % ax):
                 # This is not the same as domain_dimensions
                 dd = self.parameters['ng']
                 off = 1.0/dd
-                tr[field] = rp([ax])[0]/dd - off
+                tr[field] = rp([ax])[0]
+                tr[field] /= dd
+                tr[field] -= off
             if fname.startswith("particle_velocity_%s" % ax):
                 tr[field], = rp(['v'+ax])
         if fname.startswith("particle_mass"):
@@ -236,41 +316,358 @@ class ART_INPUT:
         if tr == {}:
             tr[field] = np.array([])
         self.cache[field] = tr[field]
-        return self.cache[field]
+        return tr[field]
 
  def _read_particle_fields(self):
         field_list = particle_fields
-        # What we need is a mapping from particle types to return types
-        for ptype in self.particle_types_raw:
-            x = self._get_field((ptype, "particle_position_x"))
-            y = self._get_field((ptype, "particle_position_y"))
-            z = self._get_field((ptype, "particle_position_z"))
+        # Species with uncached fields are decoded in one sequential pass
+        edges = np.concatenate(([0], self.ls))
+        missing = [i for i, ptype in enumerate(self.particle_types_raw)
+                   if any((ptype, f) not in self.cache for f in field_list)]
+        decoded = dict(zip(missing, read_species(
+            self._file_particle_data, self.Nrow[0], self.ls,
+            bounds=[(edges[i], edges[i+1]) for i in missing],
+            endian=self.endian, dtype=self.dtype))) if missing else {}
+        for i, ptype in enumerate(self.particle_types_raw):
+            raw = decoded.get(i)
             for field in field_list:
-                    data = self._get_field((ptype, field))
+                    data = self._get_field((ptype, field), raw=raw)
                     yield (ptype, field), data[None]
-def read_particles(file, Ngrid, idxa, idxb, fields):
+particle_words = ['x', 'y', 'z', 'vx', 'vy', 'vz']
+
+def detect_endian(file):
+    """
+    Guess the byte order of an ART file from its leading Fortran record
+    marker, falling back to a sane Nspecies in the PMcrd header layout.
+    """
+    with open(file, 'rb') as fh:
+        head = fh.read(4 + 45 + 4*16)
+    size = os.path.getsize(file)
+    for e in ('<', '>'):
+        marker = np.frombuffer(head[:4], dtype=e+'i4')[0]
+        if 0 < marker <= size - 8:
+            return e
+    for e in ('<', '>'):
+        nspecs = np.frombuffer(head[4+45+4*14:4+45+4*15], dtype=e+'i4')[0]
+        if 0 < nspecs <= 10:
+            return e
+    return endian
+
+def header_dtype(e='<'):
+    """
+    Structured dtype of the PMcrd header record, laid out after
+    dmparticle_header_struct.
+    """
+    ints = ('istep', 'Nrow', 'Ngridc', 'Nspecies', 'Nseed', 'lspecies')
+    fields = []
+    for name, count in zip(*dmparticle_header_struct):
+        if name == 'header':
+            fields.append((name, 'S45'))
+        else:
+            fields.append((name, e + ('i4' if name in ints else 'f4'),
+                           (count,) if count > 1 else ()))
+    return np.dtype(fields)
+
+def read_header(file, e=None):
+    """
+    Read the PMcrd header record in a single structured read and
+    return it in native byte order.
+    """
+    if e is None:
+        e = detect_endian(file)
+    with open(file, 'rb') as fh:
+        fh.seek(4)
+        hdr = np.fromfile(fh, count=1, dtype=header_dtype(e))
+    return hdr.astype(header_dtype('='))[0]
+
+def _to_native(data):
+    """
+    Byte-swap a decoded buffer to native order, in place.
+    """
+    if not data.dtype.isnative:
+        data.byteswap(inplace=True)
+        data = data.view(data.dtype.newbyteorder())
+    return data
+
+def map_stars(file, endian='>'):
+    """
+    Memory-map the Fortran records of an ART stars file. Per-star
+    columns come back as read-only memmaps, so nothing is read until a
+    column is used; the small header records are read as scalars.
+    """
+    stars = {}
+    size = os.path.getsize(file)
+    offset = 0
+    with open(file, 'rb') as fh:
+        for kind, names in star_struct:
+            if offset + 4 > size:
+                break
+            fh.seek(offset)
+            nbytes = int(np.fromfile(fh, dtype=endian+'i4', count=1)[0])
+            dt = np.dtype(endian+kind)
+            count = nbytes//dt.itemsize
+            if isinstance(names, tuple):
+                values = np.fromfile(fh, dtype=dt, count=count)
+                stars.update(zip(names, values.tolist()))
+            elif count == 1:
+                stars[names] = np.fromfile(fh, dtype=dt, count=1)[0].item()
+            else:
+                stars[names] = np.memmap(file, dtype=dt, mode='r',
+                                         offset=offset + 4, shape=(count,))
+            offset += nbytes + 8
+    return stars
+
+def map_particles(file, Nrow, dtype='<f4'):
+    """
+    Memory-map a PMcrs0 file as a (num_pages, 6, Nrow**2) array.
+    Nothing is read until the returned view is indexed.
+    """
+    words = len(particle_words)
+    np_per_page = Nrow**2
+    real_size = np.dtype(dtype).itemsize
+    num_pages = os.path.getsize(file)//(real_size*words*np_per_page)
+    return np.memmap(file, dtype=dtype, mode='r',
+                     shape=(num_pages, words, np_per_page))
+
+def field_view(pages, field, idxa, idxb, out=None):
+    """
+    Return particles [idxa, idxb) of one field of a mapped file.
+    The result is a view when the range lies inside a single page and
+    no out is given; otherwise the pages are copied one by one straight
+    into out (allocated if needed), converting to its dtype.
+    """
+    if not isinstance(field, (int, np.integer)):
+        field = particle_words.index(field)
+    np_per_page = pages.shape[2]
+    pa = idxa//np_per_page
+    pb = -(-idxb//np_per_page)
+    if pb > pages.shape[0]:
+        raise IOError("particle file has %i pages, %i needed"
+                      % (pages.shape[0], pb))
+    if out is None:
+        if pb - pa <= 1:
+            return pages[pa, field, idxa - pa*np_per_page:
+                         idxb - pa*np_per_page]
+        out = np.empty(idxb - idxa, dtype=pages.dtype.newbyteorder('='))
+    for p in range(pa, pb):
+        lo = max(idxa, p*np_per_page)
+        hi = min(idxb, (p + 1)*np_per_page)
+        out[lo - idxa:hi - idxa] = pages[p, field, lo - p*np_per_page:
+                                         hi - p*np_per_page]
+    return out
+
+def _readinto(fh, buf):
+    """
+    Fill buf from the current position of fh, raising IOError if the
+    file ends first.
+    """
+    view = memoryview(buf).cast('B')
+    n = fh.readinto(view)
+    if n != len(view):
+        raise IOError("%s: short read, %i of %i bytes at offset %i"
+                      % (fh.name, n or 0, len(view), fh.tell() - (n or 0)))
+
+def _pread_into(fd, buf, offset):
+    """
+    Fill buf from fd at offset with positional reads, so no file
+    pointer is shared between threads.
+    """
+    view = memoryview(buf).cast('B')
+    while len(view):
+        if hasattr(os, 'preadv'):
+            n = os.preadv(fd, [view], offset)
+        else:
+            chunk = os.pread(fd, len(view), offset)
+            n = len(chunk)
+            view[:n] = chunk
+        if n == 0:
+            raise IOError("short read, %i bytes missing at offset %i"
+                          % (len(view), offset))
+        view = view[n:]
+        offset += n
+
+def _read_threaded(file, plans, out, endian, threads):
+    """
+    Read every planned (seek, count) range on a thread pool, each
+    worker decoding its own range into the output arrays.
+    """
+    def task(job):
+        data, a, seek, count = job
+        target = data[a:a+count]
+        if data.dtype == np.dtype(endian+'f4') and target.flags.c_contiguous:
+            _pread_into(fd, target, seek)
+        else:
+            raw = np.empty(count, dtype=endian+'f4')
+            _pread_into(fd, raw, seek)
+            target[...] = _to_native(raw)
+    jobs = []
+    for plan, data in zip(plans, out):
+        a = 0
+        for seek, this_count in plan:
+            jobs.append((data, a, int(seek), int(this_count)))
+            a += this_count
+    fd = os.open(file, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(task, jobs))
+    finally:
+        os.close(fd)
+    return out
+
+def read_particles(file, Nrow, idxa, idxb, fields, mmap=False, endian='<',
+                   dtype='f8', out=None, threads=None):
+    """
+    Read particles [idxa, idxb) of the given fields. Values are returned
+    as dtype ('f4' keeps the on-disk precision, 'f8' promotes), or
+    written into the caller-supplied arrays in out, one per field.
+    With threads > 1 the page reads and conversions are spread over a
+    thread pool using positional reads.
+    """
     words = 6  # words (reals) per particle: x,y,z,vx,vy,vz
     real_size = 4  # for file_particle_data; not always true?
-    np_per_page = Ngrid**2  # defined in ART a_setup.h, # of particles/page
+    np_per_page = Nrow**2  # defined in ART a_setup.h, # of particles/page
+    if out is None:
+        out = [np.empty(idxb - idxa, dtype=dtype) for field in fields]
+    if mmap:
+        pages = map_particles(file, Nrow, dtype=endian+'f4')
+        for field, data in zip(fields, out):
+            field_view(pages, field, idxa, idxb, out=data)
+        return out
     num_pages = os.path.getsize(file)/(real_size*words*np_per_page)
-    fh = open(file, 'r')
-    skip, count = idxa, idxb - idxa
     kwargs = dict(words=words, real_size=real_size,
                   np_per_page=np_per_page, num_pages=num_pages)
-    arrs = []
-    for field in fields:
-        ranges = get_ranges(skip, count, field, **kwargs)
-        data = None
-        for seek, this_count in ranges:
-            fh.seek(seek)
-            temp = np.fromfile(fh, count=this_count, dtype='<f4')
-            if data is None:
-                data = temp
+    plans = plan_ranges(idxa, idxb - idxa, fields, **kwargs)
+    if threads is not None and threads > 1:
+        return _read_threaded(file, plans, out, endian, threads)
+    return _read_planned(file, plans, out, endian)
+
+def _read_planned(file, plans, out, endian):
+    """
+    Read every planned (seek, count) range in order, filling each output
+    array from the rows of its plan.
+    """
+    raw = None
+    with open(file, 'rb') as fh:
+        for plan, data in zip(plans, out):
+            direct = (data.dtype == np.dtype(endian+'f4')
+                      and data.flags.c_contiguous)
+            if direct:
+                buf = data
             else:
-                data = np.concatenate((data, temp))
-        arrs.append(data.astype('f8'))
-    fh.close()
-    return arrs
+                if raw is None or len(raw) < len(data):
+                    raw = np.empty(len(data), dtype=endian+'f4')
+                buf = raw
+            a = 0
+            for seek, this_count in plan:
+                fh.seek(seek)
+                _readinto(fh, buf[a:a+this_count])
+                a += this_count
+            if not direct:
+                data[...] = _to_native(raw[:len(data)])
+    return out
+
+def gather_particles(file, Nrow, indices, fields, endian='<', dtype='f8',
+                     max_gap=256, threads=None):
+    """
+    Read the given fields of arbitrary particle indices, returned in the
+    order requested. Sorted neighbouring indices closer than max_gap are
+    merged into one read (never across a page), so only the pages and
+    rows holding the requested particles are touched.
+    """
+    words = len(particle_words)
+    np_per_page = Nrow**2
+    real_size = 4
+    fi = np.array([particle_words.index(f) for f in fields], dtype='i8')
+    idx = np.asarray(indices, dtype='i8')
+    uniq, inverse = np.unique(idx, return_inverse=True)
+    if not len(uniq):
+        return [np.zeros(0, dtype=dtype) for f in fields]
+    npages = os.path.getsize(file)//(words*np_per_page*real_size)
+    if uniq[0] < 0 or uniq[-1] >= npages*np_per_page:
+        raise ValueError("particle indices must be in [0, %i), got %i..%i"
+                         % (npages*np_per_page, uniq[0], uniq[-1]))
+    page = uniq//np_per_page
+    brk = np.flatnonzero((np.diff(uniq) > max_gap) | (np.diff(page) != 0)) + 1
+    first = np.concatenate(([0], brk))
+    last = np.append(brk - 1, len(uniq) - 1)
+    starts, stops = uniq[first], uniq[last] + 1
+    counts = stops - starts
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    row_bytes = np_per_page*real_size
+    base = page[first]*words*row_bytes + (starts % np_per_page)*real_size
+    plans = [np.column_stack((base + i*row_bytes, counts)) for i in fi]
+    out = [np.empty(offsets[-1], dtype=dtype) for f in fields]
+    if threads is not None and threads > 1:
+        _read_threaded(file, plans, out, endian, threads)
+    else:
+        _read_planned(file, plans, out, endian)
+    run = np.repeat(np.arange(len(starts)), last - first + 1)
+    pos = (offsets[run] + uniq - starts[run])[inverse.ravel()]
+    return [data[pos] for data in out]
+
+def read_species(file, Nrow, lspecies, fields=particle_words, bounds=None,
+                 endian='<', dtype='f8', out=None):
+    """
+    Decode the given fields of every species in one sequential pass.
+    Each page is read once, split into its six components and the
+    pieces are routed to per-species buffers using the lspecies
+    boundaries (or explicit [idxa, idxb) bounds). Returns one
+    (len(fields), n) array of dtype per species, or fills out.
+
+    Only the bytes that are needed are read: pages outside every bound
+    are skipped, and within a page only the rows of the requested
+    fields (and, when the bounds cover part of the page, only the
+    particles they select) are read.
+    """
+    words = len(particle_words)
+    np_per_page = Nrow**2
+    fi = [particle_words.index(f) for f in fields]
+    if bounds is None:
+        edges = np.concatenate(([0], lspecies))
+        bounds = list(zip(edges[:-1], edges[1:]))
+    if out is None:
+        out = [np.empty((len(fi), b - a), dtype=dtype) for a, b in bounds]
+    # Contiguous runs of requested rows are read with a single call
+    runs = []
+    for i in sorted(set(fi)):
+        if runs and runs[-1][1] == i:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+    pages = [np.arange(a//np_per_page, -(-b//np_per_page))
+             for a, b in bounds if b > a]
+    pages = np.unique(np.concatenate(pages)) if pages else []
+    # Bounds sorted by start, so each page only visits the ones it meets
+    order = sorted(range(len(bounds)), key=lambda k: bounds[k][0])
+    starts = np.array([bounds[k][0] for k in order])
+    reach = np.maximum.accumulate([bounds[k][1] for k in order]
+                                  if order else [0])
+    page = np.empty((words, np_per_page), dtype=endian+'f4')
+    real_size = page.itemsize
+    with open(file, 'rb') as fh:
+        for p in pages:
+            lo, hi = p*np_per_page, (p + 1)*np_per_page
+            k0 = np.searchsorted(reach, lo, side='right')
+            k1 = np.searchsorted(starts, hi, side='left')
+            spans = []
+            for k in order[k0:k1]:
+                a, b = bounds[k]
+                if max(a, lo) < min(b, hi):
+                    spans.append((k, max(a, lo), min(b, hi)))
+            c0 = min(ia for k, ia, ib in spans) - lo
+            c1 = max(ib for k, ia, ib in spans) - lo
+            for r0, r1 in runs:
+                if c0 == 0 and c1 == np_per_page:
+                    fh.seek(p*page.nbytes + r0*np_per_page*real_size)
+                    _readinto(fh, page[r0:r1])
+                    continue
+                for r in range(r0, r1):
+                    fh.seek(p*page.nbytes + (r*np_per_page + c0)*real_size)
+                    _readinto(fh, page[r, c0:c1])
+            for k, ia, ib in spans:
+                a = bounds[k][0]
+                out[k][:, ia-a:ib-a] = page[fi, ia-lo:ib-lo]
+    return out
 
 def _determine_field_size(pf,field,lspecies, ptmax):
     pbool = np.zeros(len(lspecies), dtype="bool")
@@ -285,25 +682,94 @@ def _determine_field_size(pf,field,lspecies, ptmax):
     return pbool, idxa, idxb
 
 
-def find_root(f, a, b, tol=1e-6):
-    c = (a+b)/2.0
-    last = -np.inf
-    assert(np.sign(f(a)) != np.sign(f(b)))
-    while np.abs(f(c)-last) > tol:
-        last = f(c)
-        if np.sign(last) == np.sign(f(b)):
-            b = c
+def find_roots(f, a, b, tol=1e-6, xtol=0.0, bisect=4, maxiter=100):
+    """
+    Roots of a vectorized f in many brackets [a, b] at once: a few
+    bisection steps, then Illinois (modified regula falsi). f is always
+    called on arrays of the full bracket shape; converged entries are
+    frozen. An entry is done when |f| <= tol or its bracket is narrower
+    than xtol plus a few ulps.
+    """
+    a, b = np.broadcast_arrays(np.asarray(a, dtype='f8'),
+                               np.asarray(b, dtype='f8'))
+    a, b = a.copy(), b.copy()
+    fa, fb = np.asarray(f(a), dtype='f8'), np.asarray(f(b), dtype='f8')
+    assert(np.all(np.sign(fa) != np.sign(fb)))
+    eps = 4*np.finfo('f8').eps
+    for it in range(maxiter):
+        done = (np.abs(fb) <= tol) | (np.abs(b - a) <= xtol + eps*np.abs(b))
+        if np.all(done):
+            break
+        mid = 0.5*(a + b)
+        if it < bisect:
+            c = mid
         else:
-            a = c
-        c = (a+b)/2.0
-    return c
+            with np.errstate(invalid='ignore', divide='ignore'):
+                c = (a*fb - b*fa)/(fb - fa)
+            c = np.where((c - a)*(c - b) < 0, c, mid)
+        c = np.where(done, b, c)
+        fc = np.asarray(f(c), dtype='f8')
+        cross = np.sign(fc) != np.sign(fb)
+        # Keep [a, b] a bracket with b the latest point; halve the
+        # retained end if it survives twice (Illinois)
+        a = np.where(done, a, np.where(cross, b, a))
+        fa = np.where(done, fa, np.where(cross, fb, fa if it < bisect
+                                         else 0.5*fa))
+        b = np.where(done, b, c)
+        fb = np.where(done, fb, fc)
+    return b
 
-def quad(fintegrand, xmin, xmax, n=1e4):
-    spacings = np.logspace(np.log10(xmin), np.log10(xmax), n)
+def find_root(f, a, b, tol=1e-6):
+    """
+    Root of f in the single bracket [a, b]; see find_roots.
+    """
+    return find_roots(f, a, b, tol=tol)[()]
+
+_trapezoid = getattr(np, 'trapezoid', getattr(np, 'trapz', None))
+
+def quad(fintegrand, xmin, xmax, n=10000):
+    spacings = np.logspace(np.log10(xmin), np.log10(xmax), int(n))
     integrand_arr = fintegrand(spacings)
-    val = np.trapz(integrand_arr, dx=np.diff(spacings))
+    val = _trapezoid(integrand_arr, dx=np.diff(spacings))
     return val
 
+@lru_cache(maxsize=None)
+def time_table(Om0, Oml0, hubble, amin=1e-4, amax=10.0, n=2**14):
+    """
+    Cosmic time in Gyr on a log grid of expansion factors, built once
+    per (Om0, Oml0, hubble). Returns read-only (ln a, t) arrays.
+    """
+    a = np.logspace(np.log10(amin), np.log10(amax), n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # dt/dln(a) = 1/H(a); the t(amin) term assumes matter domination
+        dt = np.sqrt(a**3/(Oml0*a**3 + Om0))
+        t0 = 2.0/3.0*amin**1.5/np.sqrt(Om0) if Om0 > 0 else 0.0
+    lna = np.log(a)
+    t = t0 + np.concatenate(([0.0], np.cumsum(
+        0.5*(dt[1:] + dt[:-1])*np.diff(lna))))
+    t *= 9.779/hubble
+    lna.flags.writeable = False
+    t.flags.writeable = False
+    return lna, t
+
+def _table(Om0, Oml0, hubble):
+    return time_table(float(np.squeeze(Om0)), float(np.squeeze(Oml0)),
+                      float(np.squeeze(hubble)))
+
+def a2t(a, Om0=0.27, Oml0=0.73, hubble=0.7):
+    """
+    Cosmic time in Gyr at expansion factor a, by table lookup.
+    """
+    lna, t = _table(Om0, Oml0, hubble)
+    return np.interp(np.log(a), lna, t)
+
+def t2a(t, Om0=0.27, Oml0=0.73, hubble=0.7):
+    """
+    Expansion factor at cosmic time t in Gyr, by table lookup.
+    """
+    lna, tt = _table(Om0, Oml0, hubble)
+    return np.exp(np.interp(t, tt, lna))
+
 def get_ranges(skip, count, field, words=6, real_size=4, np_per_page=256**2,
                   num_pages=1):
     #translate every particle index into a file position ranges
@@ -332,168 +798,522 @@ def get_ranges(skip, count, field, words=6, real_size=4, np_per_page=256**2,
     assert count == 0
     return ranges
 
+def plan_ranges(skip, count, fields, words=6, real_size=4, np_per_page=256**2,
+                num_pages=1):
+    """
+    Closed-form, vectorized counterpart of get_ranges.
+    Returns one (n, 2) int64 array of (seek, count) rows per entry of
+    fields, row for row identical to get_ranges(skip, count, field).
+    """
+    fields = [f if isinstance(f, (int, np.integer))
+              else particle_words.index(f) for f in fields]
+    if count <= 0:
+        return [np.zeros((0, 2), dtype='i8') for f in fields]
+    arr_size = np_per_page * real_size
+    pa = skip//np_per_page
+    pb = (skip + count - 1)//np_per_page + 1
+    assert pb <= np.ceil(num_pages)
+    pages = np.arange(pa, pb, dtype='i8')
+    first = np.maximum(skip - pages*np_per_page, 0)
+    counts = np.minimum(skip + count - pages*np_per_page, np_per_page) - first
+    start = pages*words*arr_size + first*real_size
+    return [np.column_stack((start + i*arr_size, counts)) for i in fields]
+
+
+
+def _select(ART_IO, nstars, species, fields):
+    """
+    The components and fields (in file order) a read is restricted to,
+    plus the position axes among those fields.
+    """
+    comps = ART_IO._components(nstars)
+    if species is not None:
+        names = [name for name, a, b, m in comps]
+        keep = set(names.index(s) if isinstance(s, str) else s
+                   for s in species)
+        comps = [comps[i] for i in sorted(keep)]
+    if fields is None:
+        fields = particle_words
+    fields = [f for f in particle_words if f in fields]
+    axes = [f for f in fields if f in 'xyz']
+    return comps, fields, axes
+
+def _stellar_centre(ART_IO, nstars, axes, dtype='f8', step=2**22):
+    """
+    Mean code-unit position of the stars along the given axes,
+    accumulated over bounded chunks of the star range.
+    """
+    ng = ART_IO.parameters['ng']
+    total = np.zeros(len(axes))
+    for a in range(0, nstars, step):
+        stars, = read_species(ART_IO._file_particle_data, ART_IO.Nrow[0],
+                              ART_IO.ls, fields=axes,
+                              bounds=[(a, min(a + step, nstars))],
+                              endian=ART_IO.endian, dtype=dtype)
+        stars /= ng
+        stars -= 1.0/ng
+        total += stars.sum(axis=1, dtype='f8')
+    return total/nstars
+
+class Snapshot:
+ """
+ Columnar particle container returned by read_ART.
+
+ Each quantity (x, y, z, vx, vy, vz) is one contiguous array over all
+ components -- stars first, then one entry per dark matter species --
+ and offsets[i]:offsets[i+1] selects component i, so per-component
+ arrays are views. Per-component masses are scalars that are only
+ expanded when the mass column is asked for, and particle ids are
+ generated from the first index of each component unless an explicit
+ 'Id' column is stored.
+
+ Unpacking a Snapshot gives the mass,x,y,z,vx,vy,vz,Id lists of
+ per-component arrays that read_ART used to return.
+ """
+ quantities = ('mass', 'x', 'y', 'z', 'vx', 'vy', 'vz', 'Id')
+ def __init__(self, data, offsets, masses, names, first_index,
+                 parameters=None, centre=None, scaleC=1.0, scaleV=1.0):
+        self.data = data
+        self.offsets = np.asarray(offsets, dtype='i8')
+        self.masses = np.asarray(masses, dtype='f8')
+        self.names = list(names)
+        self.first_index = np.asarray(first_index, dtype='i8')
+        self.parameters = {} if parameters is None else parameters
+        self.centre = centre
+        self.scaleC = scaleC
+        self.scaleV = scaleV
+
+ def __len__(self):
+        return int(self.offsets[-1])
+
+ def __iter__(self):
+        for q in self.quantities:
+            if q in self.data or q in ('mass', 'Id'):
+                yield [self.component(i, q) for i in range(len(self.names))]
+            else:
+                yield None
+
+ def __getitem__(self, key):
+        if isinstance(key, tuple):
+            return self.component(*key)
+        if key == 'mass':
+            return np.repeat(self.masses, self.sizes).astype(self.dtype)
+        if key == 'Id' and key not in self.data:
+            return (np.arange(len(self), dtype='i8')
+                    + np.repeat(self.first_index - self.offsets[:-1],
+                                self.sizes))
+        return self.data[key]
+
+ @property
+ def sizes(self):
+        return np.diff(self.offsets)
+
+ @property
+ def dtype(self):
+        for values in self.data.values():
+            return values.dtype
+        return np.dtype('f8')
+
+ def index(self, component):
+        """
+        Position of a component given by index or name.
+        """
+        if isinstance(component, str):
+            return self.names.index(component)
+        return component
+
+ def component(self, component, key):
+        """
+        One quantity of one component; a view for stored columns.
+        """
+        i = self.index(component)
+        a, b = self.offsets[i], self.offsets[i+1]
+        if key == 'mass':
+            return np.full(b - a, self.masses[i], dtype=self.dtype)
+        if key == 'Id' and key not in self.data:
+            return np.arange(self.first_index[i], self.first_index[i] + b - a)
+        return self.data[key][a:b]
+
+def read_ART(path,filename,nstars,reader=ART_INPUT,dtype='f8',
+             species=None,fields=None,cache_dir=None,box=None,sphere=None,
+             memory=2**26):
+    """
+    Read a snapshot into a Snapshot in physical units, centred on the
+    mean stellar position. species selects components by name or index
+    ('stars', 'specie0', ...) and fields a subset of x, y, z, vx, vy,
+    vz; bytes belonging to anything else are never read.
+
+    box ((xmin, xmax), (ymin, ymax), (zmin, zmax)) or sphere (centre,
+    radius), in the same physical units, restricts the result to a
+    region. The file is then decoded in chunks of about memory bytes
+    and filtered as it goes, so peak memory follows the selection; the
+    Snapshot carries an explicit Id column.
 
+    With cache_dir, the converted columns of whole-snapshot reads are
+    written there once and memory-mapped instead of decoding the file
+    again; the columns are then read-only, including on the call that
+    writes them. Entries of older versions of the file are removed.
+    """
+    ART_IO = reader(path,filename,nstars,dtype=dtype)
+    ART_IO._parse_parameter_file(nstars)
+    comps, fields, axes = _select(ART_IO, nstars, species, fields)
+    if box is not None or sphere is not None:
+        centre = _stellar_centre(ART_IO, nstars, ['x', 'y', 'z'],
+                                 dtype=dtype)
+        data, offsets = _read_region(ART_IO, nstars, comps, fields, dtype,
+                                     box, sphere, memory, centre)
+        return Snapshot(data, offsets,
+                        [m for name, a, b, m in comps],
+                        [name for name, a, b, m in comps],
+                        [a for name, a, b, m in comps],
+                        parameters=ART_IO.parameters, centre=centre,
+                        scaleC=ART_IO.scaleC, scaleV=ART_IO.scaleV)
+    if cache_dir is not None:
+        key = _cache_key(ART_IO, nstars, comps, fields, dtype)
+        cache = os.path.join(cache_dir, filename + '.cache', _cache_name(key))
+        snap = _load_cache(cache, key, ART_IO)
+        if snap is None:
+            snap = _read_snapshot(ART_IO, nstars, comps, fields, axes, dtype)
+            _save_cache(cache, key, snap)
+            # Hand back the mapped copy so every call behaves the same
+            mapped = _load_cache(cache, key, ART_IO)
+            if mapped is not None:
+                snap = mapped
+        return snap
+    return _read_snapshot(ART_IO, nstars, comps, fields, axes, dtype)
 
-def read_ART(path,filename,nstars):
-    stars=[]
-    ART_IO = ART_INPUT(path,filename,nstars)
+def gather_ART(path,filename,nstars,indices,reader=ART_INPUT,dtype='f8',
+               fields=None,centre=None,max_gap=256,threads=None):
+    """
+    Read arbitrary particles by index, in the physical units of
+    read_ART and in the order requested. Returns a dict with the
+    requested x, y, z, vx, vy, vz columns plus 'Id', 'mass' and
+    'species' (the ART species number). centre is the code-unit stellar
+    centre (e.g. Snapshot.centre); if not given it is computed from the
+    star positions.
+    """
+    ART_IO = reader(path,filename,nstars,dtype=dtype)
     ART_IO._parse_parameter_file(nstars)
-    data=ART_IO._read_particle_fields()
-    nspec=len(ART_IO.parameters['wspecies'])
-    ng=ART_IO.parameters['ng']
-    dm0=[]
-    dm1=[]
-    dm2=[]
-    dm3=[]
-    dm4=[]
-    dm5=[]
-    dm6=[]
-    dm7=[]
-    dm8=[]
-    dm9=[]
-    for i in data:
-     if i[0][0] == 'specie0':
-      stars.append(i[1][0,:nstars])
-      dm0.append(i[1][0,nstars+1:])
-     if nspec>1:
-      if i[0][0] == 'specie1':
-       dm1.append(i[1][0,:])
-     if nspec>2:
-       if i[0][0] == 'specie2': 
-        dm2.append(i[1][0,:])
-     if nspec>3:
-      if i[0][0] == 'specie3':
-       dm3.append(i[1][0,:])
-     if nspec>4:
-      if i[0][0] == 'specie4':
-       dm4.append(i[1][0,:])
-     if nspec>5:
-      if i[0][0] == 'specie5':
-       dm5.append(i[1][0,:])
-     if nspec>6:
-      if i[0][0] == 'specie6':
-       dm6.append(i[1][0,:])
-     if nspec>7:
-      if i[0][0] == 'specie7':
-       dm7.append(i[1][0,:])
-     if nspec>8:
-      if i[0][0] == 'specie8':
-       dm8.append(i[1][0,:])
-     if nspec>9:
-      if i[0][0] == 'specie9':
-       dm9.append(i[1][0,:])
-     if nspec>10:
-       print('TOO MANY PARTICLE SPECIES!!!')
-    print('After appending')
-    mass=[]
-    x=[]
-    y=[]
-    z=[]
-    vx=[]
-    vy= []
-    vz=[]
-    Id=[]
-    mass.append(stars[0][:]*0.+ART_IO.scaleM)
-    mass.append(dm0[0][:]*0.+ART_IO.scaleM)
-    Id.append(stars[1][:])
-    Id.append(dm0[1][:])
-    x.append((stars[3][:]))
-    xmean=np.mean(x)
-    y.append((stars[4][:]))
-    ymean=np.mean(y)
-    z.append((stars[5][:]))
-    zmean=np.mean(z)
-    vx.append((stars[6][:])*ART_IO.scaleV)
-    vy.append((stars[7][:])*ART_IO.scaleV)
-    vz.append((stars[8][:])*ART_IO.scaleV)
-    x.append((dm0[3][:]-xmean)*ART_IO.scaleC)
-    y.append((dm0[4][:]-ymean)*ART_IO.scaleC)
-    z.append((dm0[5][:]-zmean)*ART_IO.scaleC)
-    vx.append((dm0[6][:])*ART_IO.scaleV)
-    vy.append((dm0[7][:])*ART_IO.scaleV)
-    vz.append((dm0[8][:])*ART_IO.scaleV)
-    if nspec>1:
-     mass.append(dm1[0][:]*0.+ART_IO.scaleM*2**1)
-     x.append((dm1[3][:]-xmean)*ART_IO.scaleC)
-     y.append((dm1[4][:]-ymean)*ART_IO.scaleC)
-     z.append((dm1[5][:]-zmean)*ART_IO.scaleC)
-     vx.append((dm1[6][:])*ART_IO.scaleV)
-     vy.append((dm1[7][:])*ART_IO.scaleV)
-     vz.append((dm1[8][:])*ART_IO.scaleV)
-     Id.append(dm1[1][:])
-    if nspec>2:
-     mass.append(dm2[0][:]*0.+ART_IO.scaleM*2**2)
-     x.append((dm2[3][:]-xmean)*ART_IO.scaleC)
-     y.append((dm2[4][:]-ymean)*ART_IO.scaleC)
-     z.append((dm2[5][:]-zmean)*ART_IO.scaleC)
-     vx.append((dm2[6][:])*ART_IO.scaleV)
-     vy.append((dm2[7][:])*ART_IO.scaleV)
-     vz.append((dm2[8][:])*ART_IO.scaleV)
-     Id.append(dm2[1][:])
-    if nspec>3:
-     mass.append(dm3[0][:]*0.+ART_IO.scaleM*2**3)
-     x.append((dm3[3][:]-xmean)*ART_IO.scaleC)
-     y.append((dm3[4][:]-ymean)*ART_IO.scaleC)
-     z.append((dm3[5][:]-zmean)*ART_IO.scaleC)
-     vx.append((dm3[6][:])*ART_IO.scaleV)
-     vy.append((dm3[7][:])*ART_IO.scaleV)
-     vz.append((dm3[8][:])*ART_IO.scaleV)
-     Id.append(dm3[1][:])
-    if nspec>4:
-     mass.append(dm4[0][:]*0.+ART_IO.scaleM*2**4)
-     x.append((dm4[3][:]-xmean)*ART_IO.scaleC)
-     y.append((dm4[4][:]-ymean)*ART_IO.scaleC)
-     z.append((dm4[5][:]-zmean)*ART_IO.scaleC)
-     vx.append((dm4[6][:])*ART_IO.scaleV)
-     vy.append((dm4[7][:])*ART_IO.scaleV)
-     vz.append((dm4[8][:])*ART_IO.scaleV)
-     Id.append(dm4[1][:])
-    if nspec>5:
-     mass.append(dm5[0][:]*0.+ART_IO.scaleM*2**5)
-     x.append((dm5[3][:]-xmean)*ART_IO.scaleC)
-     y.append((dm5[4][:]-ymean)*ART_IO.scaleC)
-     z.append((dm5[5][:]-zmean)*ART_IO.scaleC)
-     vx.append((dm5[6][:])*ART_IO.scaleV)
-     vy.append((dm5[7][:])*ART_IO.scaleV)
-     vz.append((dm5[8][:])*ART_IO.scaleV)
-     Id.append(dm5[1][:])
-    if nspec>6:
-     mass.append(dm6[0][:]*0.+ART_IO.scaleM*2**6)
-     x.append((dm6[3][:]-xmean)*ART_IO.scaleC)
-     y.append((dm6[4][:]-ymean)*ART_IO.scaleC)
-     z.append((dm6[5][:]-zmean)*ART_IO.scaleC)
-     vx.append((dm6[6][:])*ART_IO.scaleV)
-     vy.append((dm6[7][:])*ART_IO.scaleV)
-     vz.append((dm6[8][:])*ART_IO.scaleV)
-     Id.append(dm6[1][:])
-    if nspec>7:
-     mass.append(dm7[0][:]*0.+ART_IO.scaleM*2**7)
-     x.append((dm7[3][:]-xmean)*ART_IO.scaleC)
-     y.append((dm7[4][:]-ymean)*ART_IO.scaleC)
-     z.append((dm7[5][:]-zmean)*ART_IO.scaleC)
-     vx.append((dm7[6][:])*ART_IO.scaleV)
-     vy.append((dm7[7][:])*ART_IO.scaleV)
-     vz.append((dm7[8][:])*ART_IO.scaleV)
-     Id.append(dm7[1][:])
-    if nspec>8: 
-     mass.append(dm8[0][:]*0.+ART_IO.scaleM*2**8)
-     x.append((dm8[3][:]-xmean)*ART_IO.scaleC)
-     y.append((dm8[4][:]-ymean)*ART_IO.scaleC)
-     z.append((dm8[5][:]-zmean)*ART_IO.scaleC)
-     vx.append((dm8[6][:])*ART_IO.scaleV)
-     vy.append((dm8[7][:])*ART_IO.scaleV)
-     vz.append((dm8[8][:])*ART_IO.scaleV)
-     Id.append(dm8[1][:])
-    if nspec>9:
-     mass.append(dm9[0][:]*0.+ART_IO.scaleM*2**9)
-     x.append((dm9[3][:]-xmean)*ART_IO.scaleC)
-     y.append((dm9[4][:]-ymean)*ART_IO.scaleC)
-     z.append((dm9[5][:]-zmean)*ART_IO.scaleC)
-     vx.append((dm9[6][:])*ART_IO.scaleV)
-     vy.append((dm9[7][:])*ART_IO.scaleV)
-     vz.append((dm9[8][:])*ART_IO.scaleV)
-     Id.append(dm9[1][:])
-    x[0]=(x[0]-xmean)*ART_IO.scaleC
-    y[0]=(y[0]-ymean)*ART_IO.scaleC
-    z[0]=(z[0]-zmean)*ART_IO.scaleC
-    return mass,x,y,z,vx,vy,vz,Id
+    if fields is None:
+        fields = particle_words
+    fields = [f for f in particle_words if f in fields]
+    axes = [f for f in fields if f in 'xyz']
+    idx = np.asarray(indices, dtype='i8')
+    total = int(ART_IO.ls[-1])
+    if len(idx) and (idx.min() < 0 or idx.max() >= total):
+        raise ValueError("particle indices must be in [0, %i), got %i..%i"
+                         % (total, idx.min(), idx.max()))
+    values = gather_particles(ART_IO._file_particle_data, ART_IO.Nrow[0],
+                              idx, fields, endian=ART_IO.endian,
+                              dtype=dtype, max_gap=max_gap, threads=threads)
+    data = dict(zip(fields, values))
+    if axes:
+        if centre is None:
+            mean = _stellar_centre(ART_IO, nstars, axes, dtype=dtype)
+        else:
+            mean = np.asarray(centre)[['xyz'.index(ax) for ax in axes]]
+        ng = ART_IO.parameters['ng']
+        for ax, m in zip(axes, mean):
+            data[ax] /= ng
+            data[ax] -= 1.0/ng + m
+            data[ax] *= ART_IO.scaleC
+    for f in fields:
+        if f not in axes:
+            data[f] *= ART_IO.scaleV
+    specie = np.searchsorted(ART_IO.ls, idx, side='right')
+    masses = np.array([float(np.squeeze(ART_IO.species_mass(i)))
+                       for i in range(len(ART_IO.ls))])
+    data['Id'] = idx
+    data['mass'] = masses[specie].astype(dtype)
+    data['species'] = specie
+    return data
+
+def _read_snapshot(ART_IO, nstars, comps, fields, axes, dtype):
+    offsets = np.cumsum([0]+[b - a for name, a, b, m in comps])
+    # Decode every component straight into one block per quantity
+    block = np.empty((len(fields), offsets[-1]), dtype=dtype)
+    read_species(ART_IO._file_particle_data, ART_IO.Nrow[0], ART_IO.ls,
+                 fields=fields, bounds=[(a, b) for name, a, b, m in comps],
+                 endian=ART_IO.endian,
+                 out=[block[:, offsets[i]:offsets[i+1]]
+                      for i in range(len(comps))])
+    pos, vel = block[:len(axes)], block[len(axes):]
+    ng = ART_IO.parameters['ng']
+    centre = np.full(3, np.nan)
+    if axes:
+        pos /= ng
+        pos -= 1.0/ng
+        if comps[0][0] == 'stars':
+            mean = pos[:, :offsets[1]].mean(axis=1, dtype='f8')
+        else:
+            mean = _stellar_centre(ART_IO, nstars, axes, dtype=dtype)
+        centre[['xyz'.index(ax) for ax in axes]] = mean
+        pos -= mean[:, None]
+        pos *= ART_IO.scaleC
+    vel *= ART_IO.scaleV
+    return Snapshot(dict(zip(fields, block)), offsets,
+                    [m for name, a, b, m in comps],
+                    [name for name, a, b, m in comps],
+                    [a for name, a, b, m in comps],
+                    parameters=ART_IO.parameters, centre=centre,
+                    scaleC=ART_IO.scaleC, scaleV=ART_IO.scaleV)
+
+def _cache_key(ART_IO, nstars, comps, fields, dtype):
+    """
+    Everything a cached snapshot depends on: the source files' size and
+    mtime, the selection, the output dtype and the unit constants.
+    """
+    sources = []
+    for file in (ART_IO._file_particle_header, ART_IO._file_particle_data):
+        st = os.stat(file)
+        sources.append([os.path.abspath(file), st.st_size, st.st_mtime])
+    return dict(sources=sources, nstars=int(nstars),
+                reader=type(ART_IO).__module__+'.'+type(ART_IO).__name__,
+                dtype=np.dtype(dtype).str, fields=list(fields),
+                components=[[name, a, b] for name, a, b, m in comps],
+                units=[float(np.squeeze(ART_IO.scaleC)),
+                       float(np.squeeze(ART_IO.scaleV)),
+                       float(ART_IO.parameters['ng'])]
+                      + [m for name, a, b, m in comps])
+
+def _cache_name(key):
+    """
+    Directory name of one cache key, so that every selection, dtype and
+    source version gets its own files.
+    """
+    text = json.dumps(key, sort_keys=True).encode()
+    return hashlib.sha1(text).hexdigest()[:16]
+
+def _load_cache(cache, key, ART_IO):
+    """
+    Memory-map a cached snapshot, or None if it is missing or stale.
+    """
+    try:
+        with open(os.path.join(cache, 'header.json')) as fh:
+            header = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if header.get('key') != key:
+        return None
+    data = {}
+    for f in header['key']['fields']:
+        data[f] = np.load(os.path.join(cache, f + '.npy'), mmap_mode='r')
+    return Snapshot(data, header['offsets'], header['masses'],
+                    header['names'], header['first_index'],
+                    parameters=ART_IO.parameters,
+                    centre=np.array(header['centre'], dtype='f8'),
+                    scaleC=ART_IO.scaleC, scaleV=ART_IO.scaleV)
+
+def _save_cache(cache, key, snap):
+    """
+    Write a snapshot as one .npy per quantity plus a JSON header. The
+    files go to a fresh directory that is renamed into place, so files
+    another Snapshot may have memory-mapped are never rewritten.
+    """
+    parent = os.path.dirname(cache)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.tmp')
+    for f, values in snap.data.items():
+        np.save(os.path.join(tmp, f + '.npy'), values)
+    with open(os.path.join(tmp, 'header.json'), 'w') as fh:
+        json.dump(dict(key=key, offsets=snap.offsets.tolist(),
+                       masses=snap.masses.tolist(), names=snap.names,
+                       first_index=snap.first_index.tolist(),
+                       centre=[None if np.isnan(c) else c
+                               for c in snap.centre.tolist()]), fh)
+    try:
+        os.replace(tmp, cache)
+    except OSError:
+        # Already written by someone else; keep theirs
+        shutil.rmtree(tmp, ignore_errors=True)
+    _prune_cache(parent, key)
+
+def _prune_cache(parent, key):
+    """
+    Remove the entries of older versions of the source files. Unlinking
+    leaves existing memory maps valid (where the OS refuses, e.g. on
+    Windows, the entry is left for a later call).
+    """
+    for name in os.listdir(parent):
+        entry = os.path.join(parent, name)
+        try:
+            with open(os.path.join(entry, 'header.json')) as fh:
+                sources = json.load(fh)['key']['sources']
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+        if sources != key['sources']:
+            shutil.rmtree(entry, ignore_errors=True)
+
+def _batch_task(job):
+    path, filename, nstars, reduce, kwargs = job
+    return reduce(read_ART(path, filename, nstars, **kwargs))
+
+def read_ART_batch(snapshots, reduce, nstars, processes=None,
+                   max_in_memory=None, **kwargs):
+    """
+    Run reduce(read_ART(...)) for every PMcrs0 file in snapshots on a
+    process pool and return the results in snapshot order. nstars is a
+    single number or one per snapshot, and kwargs are passed on to
+    read_ART; reduce must be a picklable (module level) function.
+    At most max_in_memory snapshots (default: one per process) are
+    loaded at once. A snapshot that fails gets its exception in place
+    of a result and the others keep going; if a worker dies (e.g. out
+    of memory) the pool is rebuilt and the snapshot that killed it gets
+    the BrokenProcessPool error.
+    """
+    if np.ndim(nstars) == 0:
+        nstars = [nstars]*len(snapshots)
+    jobs = []
+    for file, n in zip(snapshots, nstars):
+        path, filename = os.path.split(file)
+        jobs.append((path + os.sep, filename, n, reduce, kwargs))
+    if processes is None:
+        processes = os.cpu_count() or 1
+    limit = max_in_memory or processes
+    results = [None]*len(jobs)
+    todo = list(range(len(jobs)))[::-1]
+    # Jobs that were running when a worker died are rerun one at a time
+    # to tell the one that killed the pool from the bystanders
+    suspects = []
+    pending = {}
+    pool = ProcessPoolExecutor(max_workers=processes)
+    try:
+        while todo or suspects or pending:
+            broken = False
+            queue, cap = (suspects, 1) if suspects else (todo, limit)
+            while queue and len(pending) < cap:
+                i = queue.pop()
+                try:
+                    pending[pool.submit(_batch_task, jobs[i])] = i
+                except BrokenProcessPool:
+                    queue.append(i)
+                    broken = True
+                    break
+            if not broken:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                broken = any(isinstance(future.exception(), BrokenProcessPool)
+                             for future in done)
+            if broken:
+                done = list(pending)
+            lost = []
+            for future in done:
+                i = pending.pop(future)
+                try:
+                    results[i] = future.result()
+                except BrokenProcessPool as err:
+                    lost.append((i, err))
+                except Exception as err:
+                    print('%s failed: %r' % (snapshots[i], err))
+                    results[i] = err
+            if broken:
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = ProcessPoolExecutor(max_workers=processes)
+                if len(lost) == 1:
+                    i, err = lost[0]
+                    print('%s failed: %r' % (snapshots[i], err))
+                    results[i] = err
+                else:
+                    suspects.extend(i for i, err in lost[::-1])
+    finally:
+        pool.shutdown()
+    return results
+
+def iter_ART(path,filename,nstars,reader=ART_INPUT,dtype='f8',
+             species=None,fields=None,memory=2**26):
+    """
+    Stream a snapshot in page-aligned chunks using about memory bytes.
+    Each chunk is a dict with the requested x, y, z, vx, vy, vz columns,
+    'mass' and 'species' (an index into the selected components, in the
+    order of Snapshot.names), in the same physical units as read_ART.
+    The buffers are reused from one chunk to the next, so copy anything
+    that has to outlive an iteration step.
+    """
+    ART_IO = reader(path,filename,nstars,dtype=dtype)
+    ART_IO._parse_parameter_file(nstars)
+    comps, fields, axes = _select(ART_IO, nstars, species, fields)
+    for chunk, spans in _chunks(ART_IO, nstars, comps, fields, axes,
+                                dtype, memory):
+        yield chunk
+
+def _chunks(ART_IO, nstars, comps, fields, axes, dtype, memory, mean=None):
+    """
+    The chunk generator behind iter_ART; also yields the (component,
+    idxa, idxb) spans each chunk was decoded from. mean is the stellar
+    centre along axes, computed here when not given.
+    """
+    if not comps:
+        return
+    ng = ART_IO.parameters['ng']
+    np_per_page = int(ART_IO.Nrow[0])**2
+    per_particle = (len(fields) + 1)*np.dtype(dtype).itemsize + 1
+    step = max(1, memory//(np_per_page*per_particle))*np_per_page
+    if mean is None:
+        mean = _stellar_centre(ART_IO, nstars, axes, dtype=dtype, step=step)
+    masses = np.array([m for name, a, b, m in comps])
+    block = np.empty((len(fields), step), dtype=dtype)
+    mass = np.empty(step, dtype=dtype)
+    specie = np.empty(step, dtype='i1')
+    lo = min(a for name, a, b, m in comps)//np_per_page*np_per_page
+    hi = max(b for name, a, b, m in comps)
+    for start in range(lo, hi, step):
+        spans = [(i, max(a, start), min(b, start + step))
+                 for i, (name, a, b, m) in enumerate(comps)]
+        spans = [(i, a, b) for i, a, b in spans if a < b]
+        if not spans:
+            continue
+        idx = np.array([i for i, a, b in spans])
+        sizes = np.array([b - a for i, a, b in spans])
+        offsets = np.concatenate(([0], np.cumsum(sizes)))
+        n = offsets[-1]
+        read_species(ART_IO._file_particle_data, ART_IO.Nrow[0], ART_IO.ls,
+                     fields=fields, bounds=[(a, b) for i, a, b in spans],
+                     endian=ART_IO.endian,
+                     out=[block[:, offsets[k]:offsets[k+1]]
+                          for k in range(len(spans))])
+        pos, vel = block[:len(axes), :n], block[len(axes):, :n]
+        pos /= ng
+        pos -= 1.0/ng
+        pos -= mean[:, None]
+        pos *= ART_IO.scaleC
+        vel *= ART_IO.scaleV
+        mass[:n] = np.repeat(masses[idx], sizes)
+        specie[:n] = np.repeat(idx, sizes)
+        chunk = dict(zip(fields, block[:, :n]))
+        chunk['mass'] = mass[:n]
+        chunk['species'] = specie[:n]
+        yield chunk, spans
+
+def _read_region(ART_IO, nstars, comps, fields, dtype, box, sphere,
+                 memory, centre):
+    """
+    Stream the selected components and keep only the particles inside
+    box or sphere, so memory scales with the selection.
+    """
+    read = [f for f in particle_words if f in fields or f in 'xyz']
+    parts = dict((f, []) for f in fields + ['Id'])
+    counts = np.zeros(len(comps), dtype='i8')
+    if sphere is not None:
+        sc, radius = np.asarray(sphere[0], dtype='f8'), sphere[1]
+    else:
+        lo, hi = np.asarray(box, dtype='f8').T
+    for chunk, spans in _chunks(ART_IO, nstars, comps, read, ['x', 'y', 'z'],
+                                dtype, memory, mean=centre):
+        if sphere is not None:
+            r2 = (chunk['x'] - sc[0])**2
+            r2 += (chunk['y'] - sc[1])**2
+            r2 += (chunk['z'] - sc[2])**2
+            mask = r2 <= radius**2
+        else:
+            mask = np.ones(len(chunk['x']), dtype=bool)
+            for d, ax in enumerate('xyz'):
+                mask &= (chunk[ax] >= lo[d]) & (chunk[ax] <= hi[d])
+        for f in fields:
+            parts[f].append(chunk[f][mask])
+        ids = np.concatenate([np.arange(a, b) for i, a, b in spans])
+        parts['Id'].append(ids[mask])
+        counts += np.bincount(chunk['species'][mask], minlength=len(comps))
+    data = {}
+    for f in parts:
+        data[f] = (np.concatenate(parts[f]) if parts[f]
+                   else np.zeros(0, dtype='i8' if f == 'Id' else dtype))
+    return data, np.concatenate(([0], np.cumsum(counts)))
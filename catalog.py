@@ -0,0 +1,117 @@
+"""
+Header-only catalog of ART snapshots
+
+Reads the PMcrd header of every snapshot in a time series and keeps the
+results in an on-disk index keyed by path, size and mtime, so that
+selecting snapshots by expansion factor or plotting Ekin against time
+never touches particle data.
+"""
+import glob
+import json
+import os
+import numpy as np
+
+from READ_ART import read_header, header_dtype, a2t
+from definitions import filename_pattern, dmparticle_header_struct
+
+catalog_index = 'art_catalog.json'
+
+# Header words kept in the catalog; extras1/extras2 are run specific
+catalog_fields = [name for name, count in zip(*dmparticle_header_struct)
+                  if name not in ('header', 'extras1', 'extras2')]
+
+
+def header_file(file):
+    """
+    Map a PMcrs0 particle file to its PMcrd header file.
+    """
+    path, name = os.path.split(file)
+    data_prefix = filename_pattern['particle_data'][0]
+    header_prefix = filename_pattern['particle_header'][0]
+    if name.startswith(data_prefix):
+        name = header_prefix + name[len(data_prefix):]
+    return os.path.join(path, name)
+
+
+def _header_record(file):
+    hdr = read_header(file)
+    record = {}
+    for name in catalog_fields:
+        value = hdr[name]
+        if np.ndim(value):
+            record[name] = value.tolist()
+        else:
+            record[name] = value.item()
+    return record
+
+
+def build_catalog(files, index_file=None):
+    """
+    Build the catalog for a glob pattern or a list of PMcrs0/PMcrd
+    files. Headers already in the index with an unchanged size and mtime
+    are not read again. Returns a structured array sorted by aexpn with
+    one row per snapshot.
+    """
+    if isinstance(files, str):
+        files = glob.glob(files)
+    files = sorted(os.path.abspath(f) for f in files)
+    if index_file is None and files:
+        index_file = os.path.join(os.path.dirname(files[0]), catalog_index)
+    index = {}
+    if index_file is not None and os.path.exists(index_file):
+        with open(index_file) as fh:
+            index = json.load(fh)
+    changed = False
+    rows = []
+    for file in files:
+        hfile = header_file(file)
+        st = os.stat(hfile)
+        entry = index.get(hfile)
+        if (entry is None or entry['size'] != st.st_size
+                or entry['mtime'] != st.st_mtime):
+            entry = dict(size=st.st_size, mtime=st.st_mtime,
+                         record=_header_record(hfile))
+            index[hfile] = entry
+            changed = True
+        rows.append((file, entry['record']))
+    if changed and index_file is not None:
+        tmp = index_file + '.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump(index, fh)
+        os.replace(tmp, index_file)
+    return _catalog_array(rows)
+
+
+def _catalog_array(rows):
+    width = max([len(file) for file, record in rows] + [1])
+    dtype = [('path', 'U%i' % width)]
+    hdt = header_dtype()
+    for name in catalog_fields:
+        kind = 'i8' if hdt[name].base.kind == 'i' else 'f8'
+        dtype.append((name, kind, hdt[name].shape))
+    cat = np.zeros(len(rows), dtype=dtype)
+    for i, (file, record) in enumerate(rows):
+        cat[i]['path'] = file
+        for name in catalog_fields:
+            cat[i][name] = record[name]
+    return cat[np.argsort(cat['aexpn'], kind='stable')]
+
+
+def select_catalog(cat, amin=-np.inf, amax=np.inf):
+    """
+    Rows of a catalog with amin <= aexpn <= amax.
+    """
+    return cat[(cat['aexpn'] >= amin) & (cat['aexpn'] <= amax)]
+
+
+def catalog_times(cat):
+    """
+    Cosmic time in Gyr of every row of a catalog, one table lookup per
+    distinct (Om0, Oml0, hubble).
+    """
+    t = np.zeros(len(cat))
+    params = np.column_stack((cat['Om0'], cat['Oml0'], cat['hubble']))
+    for p in np.unique(params, axis=0):
+        rows = np.all(params == p, axis=1)
+        t[rows] = a2t(cat['aexpn'][rows], *p)
+    return t
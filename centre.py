@@ -0,0 +1,94 @@
+"""
+Shrinking-sphere centre finder for Snapshot containers
+
+Starting from the (optionally mass-weighted) mean, the particles
+closest to the current centre are kept with np.argpartition and the
+centre is recomputed from them, so the working set shrinks
+geometrically: the first iteration is O(N) and the rest together cost
+about as much again.
+"""
+import numpy as np
+
+
+def _positions(snap, component):
+    if component is None:
+        pos = [snap['x'], snap['y'], snap['z']]
+        mass = snap['mass']
+    else:
+        pos = [snap.component(component, q) for q in ('x', 'y', 'z')]
+        mass = snap.component(component, 'mass')
+    return np.array(pos, dtype='f8'), np.asarray(mass, dtype='f8')
+
+
+def _mean(pos, mass, weighted):
+    if weighted:
+        return (pos*mass).sum(axis=1)/mass.sum()
+    return pos.mean(axis=1)
+
+
+def density_peak(pos, mass, nngb=8, step=2**10):
+    """
+    Position of the particle with the highest nngb-neighbour density
+    estimate in a small (3, n) set, by brute-force pairwise distances.
+    """
+    n = pos.shape[1]
+    nngb = min(nngb, n - 1)
+    if nngb < 1:
+        return pos[:, 0].copy()
+    rho = np.empty(n)
+    for a in range(0, n, step):
+        b = min(a + step, n)
+        d2 = ((pos[:, a:b, None] - pos[:, None, :])**2).sum(axis=0)
+        near = np.argpartition(d2, nngb, axis=1)[:, :nngb + 1]
+        rk = np.take_along_axis(d2, near, axis=1).max(axis=1)
+        rho[a:b] = mass[near].sum(axis=1)/np.maximum(rk, 1e-300)**1.5
+    return pos[:, np.argmax(rho)].copy()
+
+
+def shrinking_sphere(snap, component=None, start=None, shrink=0.75,
+                     min_particles=100, weighted=False, peak=False,
+                     tol=0.0):
+    """
+    Centre of a Snapshot (or of one component, by index or name) in the
+    frame of its positions. Each iteration keeps the fraction shrink of
+    the working set closest to the current centre until min_particles
+    remain or the centre moves by no more than tol. weighted uses the
+    particle masses; peak returns the density peak of the final set
+    instead of its mean.
+    """
+    pos, mass = _positions(snap, component)
+    if not pos.shape[1]:
+        raise RuntimeError("No particles to centre on")
+    centre = (_mean(pos, mass, weighted) if start is None
+              else np.asarray(start, dtype='f8'))
+    while True:
+        n = pos.shape[1]
+        k = max(min(min_particles, n), int(n*shrink))
+        if k < n:
+            r2 = ((pos - centre[:, None])**2).sum(axis=0)
+            keep = np.argpartition(r2, k - 1)[:k]
+            pos, mass = pos[:, keep], mass[keep]
+        new = _mean(pos, mass, weighted)
+        moved = np.sqrt(((new - centre)**2).sum())
+        centre = new
+        if k == n or k <= min_particles or moved <= tol:
+            break
+    if peak:
+        centre = density_peak(pos, mass)
+    return centre
+
+
+def recentre(snap, centre):
+    """
+    Shift the positions of a Snapshot so that centre (in its current
+    frame) becomes the origin. Columns are replaced rather than
+    modified, so memory-mapped snapshots stay untouched on disk.
+    """
+    centre = np.asarray(centre, dtype='f8')
+    for i, q in enumerate(('x', 'y', 'z')):
+        if q in snap.data:
+            snap.data[q] = snap.data[q] - snap.data[q].dtype.type(centre[i])
+    if snap.centre is not None:
+        scaleC = float(np.squeeze(snap.scaleC))
+        snap.centre = snap.centre + centre/scaleC
+    return snap
@@ -58,6 +58,18 @@ dmparticle_header_struct = [
      1,1,1,10,10,71,1,1,6,1)
 ]
 
+# Fortran records of the stars file; the byte order is that of the header
+star_struct = [
+    ('d', ('t_stars', 'a_stars')),
+    ('i', 'nstars'),
+    ('d', ('ws_old', 'ws_oldi')),
+    ('f', 'particle_mass'),
+    ('f', 'particle_mass_initial'),
+    ('f', 'particle_creation_time'),
+    ('f', 'particle_metallicity1'),
+    ('f', 'particle_metallicity2')
+]
+
 constants = {
     "Y_p": 0.245,
     "gamma": 5./3.,
@@ -0,0 +1,159 @@
+"""
+Mass deposition of particles onto a 3D mesh
+
+NGP, CIC and TSC kernels are applied per axis and the 1, 8 or 27
+neighbouring cells of a chunk of particles are accumulated with a
+single np.bincount. With threads, each worker sums its own share of the
+chunks into a private mesh and the meshes are added at the end.
+interpolate applies the same kernels the other way, from mesh to
+particles.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+kernels = ('ngp', 'cic', 'tsc')
+
+
+def _weights(s, kernel):
+    # Cell indices and weights along one axis, s in cell units
+    if kernel == 'ngp':
+        i = np.floor(s).astype('i8')
+        return i[:, None], np.ones((len(s), 1))
+    if kernel == 'cic':
+        s = s - 0.5
+        i = np.floor(s).astype('i8')
+        d = s - i
+        return i[:, None] + np.arange(2), np.column_stack((1 - d, d))
+    if kernel == 'tsc':
+        i = np.floor(s).astype('i8')
+        d = s - i - 0.5
+        w = np.column_stack((0.5*(0.5 - d)**2, 0.75 - d**2, 0.5*(0.5 + d)**2))
+        return i[:, None] + np.arange(-1, 2), w
+    raise RuntimeError("Unknown kernel %s, use one of %s" % (kernel, kernels))
+
+
+def _chunk_weights(pos, n, left, width, kernel, periodic):
+    idx, w = [], []
+    for d in range(3):
+        i, wd = _weights((pos[d] - left[d])*(n[d]/width[d]), kernel)
+        if periodic:
+            i %= n[d]
+        else:
+            outside = (i < 0) | (i >= n[d])
+            wd[outside] = 0.0
+            np.clip(i, 0, n[d] - 1, out=i)
+        idx.append(i)
+        w.append(wd)
+    return idx, w
+
+
+def _deposit_chunk(grid, pos, mass, n, left, width, kernel, periodic):
+    idx, w = _chunk_weights(pos, n, left, width, kernel, periodic)
+    # Flat cells and weights of all k**3 neighbours, (N, k, k, k), so
+    # one bincount covers the chunk
+    cell = ((idx[0][:, :, None, None]*n[1] + idx[1][:, None, :, None])*n[2]
+            + idx[2][:, None, None, :])
+    weight = (w[0][:, :, None, None]*w[1][:, None, :, None]
+              *w[2][:, None, None, :]*mass[:, None, None, None])
+    grid += np.bincount(cell.ravel(), weights=weight.ravel(),
+                        minlength=grid.size)
+
+
+def deposit(pos, mass, n, left, width, kernel='cic', periodic=False,
+            chunk=2**20, threads=None):
+    """
+    Mass per cell of a mesh with n cells per side (an int or three)
+    covering left <= x < left + width. pos is (3, N) and mass a scalar
+    or N values. Mass falling outside a non-periodic mesh is dropped.
+    """
+    kernel = kernel.lower()
+    n = np.broadcast_to(np.asarray(n, dtype='i8'), (3,))
+    left = np.broadcast_to(np.asarray(left, dtype='f8'), (3,))
+    width = np.broadcast_to(np.asarray(width, dtype='f8'), (3,))
+    npart = np.shape(pos)[1]
+    mass = np.broadcast_to(np.asarray(mass, dtype='f8'), (npart,))
+    starts = range(0, npart, chunk)
+
+    def work(share):
+        grid = np.zeros(int(np.prod(n)))
+        for a in share:
+            b = min(a + chunk, npart)
+            p = np.asarray([pos[d][a:b] for d in range(3)], dtype='f8')
+            _deposit_chunk(grid, p, mass[a:b], n, left, width, kernel,
+                           periodic)
+        return grid
+
+    threads = min(threads or 1, max(len(starts), 1))
+    if threads > 1:
+        with ThreadPoolExecutor(threads) as pool:
+            grids = list(pool.map(work, [starts[t::threads]
+                                         for t in range(threads)]))
+        grid = grids[0]
+        for g in grids[1:]:
+            grid += g
+    else:
+        grid = work(starts)
+    return grid.reshape(tuple(n))
+
+
+def interpolate(meshes, pos, left, width, kernel='cic', periodic=False,
+                chunk=2**20):
+    """
+    Values of one or more meshes of equal shape at the (3, N) positions
+    pos, with the same kernel and mesh geometry as deposit. Returns a
+    (len(meshes), N) array; outside a non-periodic mesh values are 0.
+    """
+    kernel = kernel.lower()
+    n = np.asarray(meshes[0].shape, dtype='i8')
+    left = np.broadcast_to(np.asarray(left, dtype='f8'), (3,))
+    width = np.broadcast_to(np.asarray(width, dtype='f8'), (3,))
+    flat = [np.ravel(m) for m in meshes]
+    npart = np.shape(pos)[1]
+    out = np.zeros((len(meshes), npart))
+    for a in range(0, npart, chunk):
+        b = min(a + chunk, npart)
+        p = np.asarray([pos[d][a:b] for d in range(3)], dtype='f8')
+        idx, w = _chunk_weights(p, n, left, width, kernel, periodic)
+        k = idx[0].shape[1]
+        for i in range(k):
+            for j in range(k):
+                for l in range(k):
+                    cell = (idx[0][:, i]*n[1] + idx[1][:, j])*n[2] \
+                        + idx[2][:, l]
+                    wijl = w[0][:, i]*w[1][:, j]*w[2][:, l]
+                    for m, values in enumerate(flat):
+                        out[m, a:b] += wijl*values[cell]
+    return out
+
+
+def deposit_snapshot(snap, component=None, n=None, kernel='cic',
+                     density=True, left=None, width=None, periodic=False,
+                     chunk=2**20, threads=None):
+    """
+    Deposit a Snapshot, or one component of it, on a mesh. By default
+    the mesh has Ngridc cells per side and covers the whole simulation
+    box in the snapshot's physical frame. Returns mass per unit volume,
+    or mass per cell without density.
+    """
+    if component is None:
+        pos = [snap['x'], snap['y'], snap['z']]
+        mass = snap['mass']
+    else:
+        pos = [snap.component(component, q) for q in ('x', 'y', 'z')]
+        mass = snap.masses[snap.index(component)]
+    if n is None:
+        n = int(np.squeeze(snap.parameters['Ngridc']))
+    scaleC = float(np.squeeze(snap.scaleC))
+    if left is None:
+        if snap.centre is None:
+            raise RuntimeError("Snapshot has no centre, give left and width")
+        left = -np.asarray(snap.centre, dtype='f8')*scaleC
+    if width is None:
+        width = scaleC
+    grid = deposit(pos, mass, n, left, width, kernel=kernel,
+                   periodic=periodic, chunk=chunk, threads=threads)
+    if density:
+        n = np.broadcast_to(np.asarray(n), (3,))
+        width = np.broadcast_to(np.asarray(width, dtype='f8'), (3,))
+        grid /= np.prod(width/n)
+    return grid
@@ -0,0 +1,142 @@
+"""
+Friends-of-friends groups on a spatial hash
+
+Particles are binned on cells the size of the linking length and sorted
+by cell, so every pair closer than the linking length lies in the same
+cell or in one of its 13 "forward" neighbours. Candidate pairs are
+generated cell pair by cell pair in bounded chunks and the linked ones
+are merged with a vectorized union-find (np.minimum.at hooking, with
+the parent array flattened by pointer jumping after every hook).
+"""
+import numpy as np
+
+# Self cell plus the half of the 26 neighbours that follow it
+offsets = [(0, 0, 0)] + [(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1)
+                         for k in (-1, 0, 1) if (i, j, k) > (0, 0, 0)]
+
+
+def _roots(parent, i):
+    # Follow parents until every entry points at its root
+    while True:
+        p = parent[i]
+        if np.array_equal(p, i):
+            return i
+        i = p
+
+
+def _compress(parent):
+    # Pointer jumping until every particle points at its root
+    while True:
+        up = parent[parent]
+        if np.array_equal(up, parent):
+            return
+        parent[:] = up
+
+
+def _union(parent, i, j):
+    while len(i):
+        ri, rj = _roots(parent, i), _roots(parent, j)
+        todo = ri != rj
+        if not todo.any():
+            return
+        ri, rj = ri[todo], rj[todo]
+        np.minimum.at(parent, np.maximum(ri, rj), np.minimum(ri, rj))
+        # Hooking can chain roots; flatten so _roots stays one step
+        _compress(parent)
+        i, j = ri, rj
+
+
+def _pairs(starts, counts, a, b, same):
+    # All (i, j) sorted-particle pairs between cells a and b
+    na, nb = counts[a], counts[b]
+    w = na*nb
+    first = np.repeat(np.cumsum(w) - w, w)
+    k = np.arange(w.sum()) - first
+    nbr = np.repeat(nb, w)
+    i = np.repeat(starts[a], w) + k//nbr
+    j = np.repeat(starts[b], w) + k % nbr
+    if same:
+        keep = i < j
+        i, j = i[keep], j[keep]
+    return i, j
+
+
+def fof(pos, b, mass=None, min_size=20, chunk=2**22):
+    """
+    Friends-of-friends groups of the (3, N) positions pos with linking
+    length b. Groups are numbered by decreasing size; particles in
+    groups smaller than min_size get -1.
+
+    Returns a dict with group (N,), and per group size, mass and the
+    centre of mass (3, ngroups). chunk bounds the number of candidate
+    pairs held at once (a single dense cell pair may exceed it).
+    """
+    pos = np.asarray(pos, dtype='f8')
+    npart = pos.shape[1]
+    mass = np.ones(npart) if mass is None else \
+        np.broadcast_to(np.asarray(mass, dtype='f8'), (npart,))
+    cell = np.floor((pos - pos.min(axis=1)[:, None])/b).astype('i8') + 1
+    dims = cell.max(axis=1) + 2
+    key = (cell[0]*dims[1] + cell[1])*dims[2] + cell[2]
+    order = np.argsort(key, kind='stable')
+    p = pos[:, order]
+    keys, starts, counts = np.unique(key[order], return_index=True,
+                                     return_counts=True)
+    ci = keys//(dims[1]*dims[2])
+    cj = keys//dims[2] % dims[1]
+    ck = keys % dims[2]
+    parent = np.arange(npart)
+    b2 = b*b
+    for dx, dy, dz in offsets:
+        nkey = ((ci + dx)*dims[1] + cj + dy)*dims[2] + ck + dz
+        hit = np.minimum(np.searchsorted(keys, nkey), len(keys) - 1)
+        found = keys[hit] == nkey
+        a, c = np.flatnonzero(found), hit[found]
+        work = np.cumsum(counts[a]*counts[c])
+        # Cut the cell pairs into runs of about chunk candidate pairs
+        cuts = np.searchsorted(work, np.arange(chunk, work[-1] if len(work)
+                                               else 0, chunk))
+        for s0, s1 in zip(np.concatenate(([0], cuts)),
+                          np.append(cuts, len(a))):
+            if s1 <= s0:
+                continue
+            i, j = _pairs(starts, counts, a[s0:s1], c[s0:s1],
+                          (dx, dy, dz) == (0, 0, 0))
+            d2 = ((p[:, i] - p[:, j])**2).sum(axis=0)
+            link = d2 <= b2
+            _union(parent, i[link], j[link])
+    _compress(parent)
+    roots, label, size = np.unique(parent, return_inverse=True,
+                                   return_counts=True)
+    rank = np.argsort(-size, kind='stable')
+    big = size[rank] >= min_size
+    new = np.full(len(roots), -1)
+    new[rank[big]] = np.arange(big.sum())
+    group = np.empty(npart, dtype='i8')
+    group[order] = new[label]
+    ngroups = int(big.sum())
+    inside = group >= 0
+    gmass = np.bincount(group[inside], weights=mass[inside],
+                        minlength=ngroups)
+    centre = np.array([np.bincount(group[inside],
+                                   weights=(mass*pos[d])[inside],
+                                   minlength=ngroups) for d in range(3)])
+    return dict(group=group, size=size[rank[big]], mass=gmass,
+                centre=centre/np.where(gmass > 0, gmass, 1.0))
+
+
+def fof_snapshot(snap, b, components=None, min_size=20, chunk=2**22):
+    """
+    fof on the particles of a Snapshot, or of the components given by
+    name or index, with their masses. The result also holds the
+    particle Id of each entry of group.
+    """
+    if components is None:
+        components = range(len(snap.names))
+    comps = [snap.index(c) for c in components]
+    pos = [np.concatenate([snap.component(i, q) for i in comps])
+           for q in ('x', 'y', 'z')]
+    mass = np.concatenate([snap.component(i, 'mass') for i in comps])
+    out = fof(pos, b, mass=mass, min_size=min_size, chunk=chunk)
+    out['Id'] = np.concatenate([snap.component(i, 'Id') for i in comps])
+    return out
@@ -0,0 +1,199 @@
+"""
+Morton (Z-order) sidecar index for ART particle files
+
+A grid of 2**level cells per side is laid over the code-unit domain
+and every run of consecutive particle indices that stays inside one
+cell is recorded under that cell's Morton key. Box and sphere queries
+then read only the runs of the cells they touch through the usual page
+layout, so their I/O scales with the size of the region rather than
+with the snapshot.
+"""
+import os
+import numpy as np
+
+from READ_ART import ART_INPUT, Snapshot, read_species, _select, \
+    _stellar_centre
+
+index_suffix = '.morton.npz'
+
+
+def _spread(v):
+    # Insert two zero bits between each of the low 21 bits of v
+    v = v.astype('u8') & np.uint64(0x1fffff)
+    v = (v | v << np.uint64(32)) & np.uint64(0x1f00000000ffff)
+    v = (v | v << np.uint64(16)) & np.uint64(0x1f0000ff0000ff)
+    v = (v | v << np.uint64(8)) & np.uint64(0x100f00f00f00f00f)
+    v = (v | v << np.uint64(4)) & np.uint64(0x10c30c30c30c30c3)
+    v = (v | v << np.uint64(2)) & np.uint64(0x1249249249249249)
+    return v
+
+
+def morton_keys(i, j, k):
+    """
+    Morton keys of integer cell coordinates (up to 21 bits each).
+    """
+    return _spread(i) | _spread(j) << np.uint64(1) | _spread(k) << np.uint64(2)
+
+
+def _cells(u, level):
+    n = 2**level
+    return np.clip((u*n).astype('i8'), 0, n - 1)
+
+
+def _source(ART_IO):
+    st = os.stat(ART_IO._file_particle_data)
+    return np.array([st.st_size, st.st_mtime])
+
+
+def build_index(ART_IO, nstars, level=7, memory=2**26):
+    """
+    Build the index of a parsed ART_INPUT in one sequential pass over
+    the particle positions and save it next to the particle file. The
+    code-unit centre of the first nstars particles is stored with it.
+    """
+    ng = ART_IO.parameters['ng']
+    np_per_page = int(ART_IO.Nrow[0])**2
+    total = int(ART_IO.ls[-1])
+    step = max(1, memory//(np_per_page*3*8))*np_per_page
+    keys, starts = [], []
+    last = None
+    star_sum = np.zeros(3)
+    for a in range(0, total, step):
+        b = min(a + step, total)
+        u, = read_species(ART_IO._file_particle_data, ART_IO.Nrow[0],
+                          ART_IO.ls, fields=['x', 'y', 'z'],
+                          bounds=[(a, b)], endian=ART_IO.endian)
+        u /= ng
+        u -= 1.0/ng
+        if a < nstars:
+            star_sum += u[:, :nstars - a].sum(axis=1)
+        c = _cells(u, level)
+        key = morton_keys(c[0], c[1], c[2])
+        new = np.flatnonzero(key[1:] != key[:-1]) + 1
+        if last is None or key[0] != last:
+            new = np.concatenate(([0], new))
+        keys.append(key[new])
+        starts.append(new + a)
+        last = key[-1]
+    keys = np.concatenate(keys) if keys else np.zeros(0, dtype='u8')
+    starts = np.concatenate(starts) if starts else np.zeros(0, dtype='i8')
+    stops = np.append(starts[1:], total)
+    order = np.argsort(keys, kind='stable')
+    index = dict(keys=keys[order], starts=starts[order],
+                 stops=stops[order], level=level, nstars=nstars,
+                 centre=star_sum/max(nstars, 1), source=_source(ART_IO))
+    np.savez(ART_IO._file_particle_data + index_suffix, **index)
+    return index
+
+
+def load_index(ART_IO, level=None):
+    """
+    The saved index of a particle file, or None if it is missing, was
+    built at another level, or the file changed since.
+    """
+    try:
+        with np.load(ART_IO._file_particle_data + index_suffix) as saved:
+            index = dict(saved)
+    except OSError:
+        return None
+    if not np.array_equal(index['source'], _source(ART_IO)):
+        return None
+    if level is not None and index['level'] != level:
+        return None
+    return index
+
+
+def query_runs(index, lo, hi):
+    """
+    Merged [idxa, idxb) particle runs of every cell that overlaps the
+    code-unit box lo <= u <= hi, as an (n, 2) array sorted by idxa.
+    """
+    level = int(index['level'])
+    clo = _cells(np.asarray(lo, dtype='f8'), level)
+    chi = _cells(np.asarray(hi, dtype='f8'), level)
+    i, j, k = np.meshgrid(*[np.arange(clo[d], chi[d] + 1) for d in range(3)],
+                          indexing='ij')
+    cells = np.sort(morton_keys(i.ravel(), j.ravel(), k.ravel()))
+    left = np.searchsorted(index['keys'], cells, side='left')
+    right = np.searchsorted(index['keys'], cells, side='right')
+    counts = right - left
+    hit = np.repeat(left - np.cumsum(counts) + counts, counts) \
+        + np.arange(counts.sum())
+    runs = np.column_stack((index['starts'][hit], index['stops'][hit]))
+    if not len(runs):
+        return runs
+    runs = runs[np.argsort(runs[:, 0])]
+    # Merge runs that touch so each becomes one read
+    brk = np.flatnonzero(runs[1:, 0] > runs[:-1, 1]) + 1
+    first = np.concatenate(([0], brk))
+    last = np.append(brk - 1, len(runs) - 1)
+    return np.column_stack((runs[first, 0], runs[last, 1]))
+
+
+def read_region(path, filename, nstars, box=None, sphere=None,
+                reader=ART_INPUT, dtype='f8', species=None, fields=None,
+                level=7):
+    """
+    Read only the particles inside a region, in the physical units of
+    read_ART. box is ((xmin, xmax), (ymin, ymax), (zmin, zmax)) and
+    sphere is (centre, radius). The index is built on first use.
+    Returns a Snapshot with an explicit Id column.
+    """
+    ART_IO = reader(path,filename,nstars,dtype=dtype)
+    ART_IO._parse_parameter_file(nstars)
+    comps, fields, axes = _select(ART_IO, nstars, species, fields)
+    index = load_index(ART_IO, level)
+    if index is None:
+        index = build_index(ART_IO, nstars, level=level)
+    if index['nstars'] == nstars:
+        centre = index['centre']
+    else:
+        centre = _stellar_centre(ART_IO, nstars, ['x', 'y', 'z'])
+    if sphere is not None:
+        sc, radius = np.asarray(sphere[0], dtype='f8'), sphere[1]
+        lo, hi = sc - radius, sc + radius
+    else:
+        lo, hi = np.asarray(box, dtype='f8').T
+    scaleC = float(np.squeeze(ART_IO.scaleC))
+    runs = query_runs(index, lo/scaleC + centre, hi/scaleC + centre)
+    ng = ART_IO.parameters['ng']
+    read = ['x', 'y', 'z'] + [f for f in fields if f not in 'xyz']
+    data = dict((f, []) for f in fields + ['Id'])
+    sizes = []
+    for name, a, b, m in comps:
+        k0 = np.searchsorted(runs[:, 1], a, side='right')
+        k1 = np.searchsorted(runs[:, 0], b, side='left')
+        bounds = [(max(ra, a), min(rb, b)) for ra, rb in runs[k0:k1]]
+        bounds = [(ra, rb) for ra, rb in bounds if ra < rb]
+        if not bounds:
+            sizes.append(0)
+            continue
+        block = np.concatenate(read_species(
+            ART_IO._file_particle_data, ART_IO.Nrow[0], ART_IO.ls,
+            fields=read, bounds=bounds, endian=ART_IO.endian, dtype=dtype),
+            axis=1)
+        ids = np.concatenate([np.arange(ra, rb) for ra, rb in bounds])
+        pos, vel = block[:3], block[3:]
+        pos /= ng
+        pos -= 1.0/ng
+        pos -= centre[:, None]
+        pos *= ART_IO.scaleC
+        vel *= ART_IO.scaleV
+        if sphere is not None:
+            mask = ((pos - sc[:, None])**2).sum(axis=0) <= radius**2
+        else:
+            mask = np.all((pos >= lo[:, None]) & (pos <= hi[:, None]),
+                          axis=0)
+        for f in fields:
+            data[f].append(block[read.index(f), mask])
+        data['Id'].append(ids[mask])
+        sizes.append(int(mask.sum()))
+    for f in data:
+        data[f] = (np.concatenate(data[f]) if data[f]
+                   else np.zeros(0, dtype='i8' if f == 'Id' else dtype))
+    return Snapshot(data, np.concatenate(([0], np.cumsum(sizes))),
+                    [m for name, a, b, m in comps],
+                    [name for name, a, b, m in comps],
+                    [a for name, a, b, m in comps],
+                    parameters=ART_IO.parameters, centre=centre,
+                    scaleC=ART_IO.scaleC, scaleV=ART_IO.scaleV)
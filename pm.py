@@ -0,0 +1,84 @@
+"""
+FFT particle-mesh gravity for isolated ART runs
+
+Mass is deposited with CIC on a mesh covering the box and convolved with
+the -G/r Green's function on a zero-padded mesh of twice the size
+(Hockney & Eastwood), so there are no periodic images. The acceleration
+is the centred-difference gradient of the potential, and both are
+interpolated back to the particles with the same CIC kernel, in chunks.
+"""
+import numpy as np
+
+from deposit import deposit_snapshot, interpolate
+from profiles import G
+
+# Potential at the centre of a uniform cube of side 1, unit mass and G
+cube_self_potential = -2.3800
+
+
+def green(n, cell, G=G):
+    """
+    Isolated Green's function -G/r of a mesh of n cells per side on the
+    zero-padded (2n)**3 mesh, with the self-cell set to that of a
+    uniform cube.
+    """
+    d = np.arange(2*n)
+    d = np.minimum(d, 2*n - d)*cell
+    r = np.sqrt(d[:, None, None]**2 + d[None, :, None]**2
+                + d[None, None, :]**2)
+    r[0, 0, 0] = 1.0
+    g = -G/r
+    g[0, 0, 0] = G*cube_self_potential/cell
+    return g
+
+
+def potential_mesh(mass, cell, G=G):
+    """
+    Potential on the mesh of cell masses mass (n**3 cells of size cell)
+    with isolated boundaries.
+    """
+    n = mass.shape[0]
+    padded = np.zeros((2*n,)*3)
+    padded[:n, :n, :n] = mass
+    phi = np.fft.irfftn(np.fft.rfftn(padded)*np.fft.rfftn(green(n, cell, G)),
+                        s=padded.shape)
+    return phi[:n, :n, :n]
+
+
+def acceleration_mesh(phi, cell):
+    """
+    The three components of -grad(phi) on the mesh.
+    """
+    return [-g for g in np.gradient(phi, cell)]
+
+
+def solve(snap, n=None, left=None, width=None, G=G, accel=True,
+          chunk=2**20, threads=None):
+    """
+    Potential (and acceleration) of every particle of a Snapshot. The
+    mesh defaults to Ngridc cells per side over the whole box, as in
+    deposit_snapshot; width must be the same along all axes. Units
+    follow the Snapshot (kpc, km/s and Msun for the G used here).
+
+    Returns a dict with phi (N,), acc (3, N) when accel, the potential
+    mesh and its left edge and width.
+    """
+    mass = deposit_snapshot(snap, n=n, kernel='cic', density=False,
+                            left=left, width=width, chunk=chunk,
+                            threads=threads)
+    n = mass.shape[0]
+    scaleC = float(np.squeeze(snap.scaleC))
+    if left is None:
+        left = -np.asarray(snap.centre, dtype='f8')*scaleC
+    if width is None:
+        width = scaleC
+    width = float(np.squeeze(width))
+    cell = width/n
+    phi = potential_mesh(mass, cell, G)
+    meshes = [phi] + (acceleration_mesh(phi, cell) if accel else [])
+    pos = [snap['x'], snap['y'], snap['z']]
+    values = interpolate(meshes, pos, left, width, kernel='cic', chunk=chunk)
+    out = dict(phi=values[0], mesh=phi, left=left, width=width)
+    if accel:
+        out['acc'] = values[1:]
+    return out
@@ -0,0 +1,104 @@
+"""
+Radial profiles and Lagrangian radii of Snapshot components
+
+Particles are sorted by radius once per component; bin totals of mass,
+velocity and squared velocity then come from differences of cumulative
+sums at the bin edges (np.searchsorted), with no per-bin masking.
+"""
+import numpy as np
+
+# Gravitational constant in kpc (km/s)**2 / Msun
+G = 4.30091e-6
+
+lagrangian_fractions = (0.1, 0.5, 0.9)
+
+
+def _edges(r, bins, rmin, rmax, log):
+    if np.ndim(bins):
+        return np.asarray(bins, dtype='f8')
+    if rmax is None:
+        rmax = r.max() if len(r) else 1.0
+    if log:
+        if rmin is None:
+            positive = r[r > 0]
+            rmin = positive.min() if len(positive) else rmax*1e-3
+        return np.logspace(np.log10(rmin), np.log10(rmax), bins + 1)
+    return np.linspace(0.0 if rmin is None else rmin, rmax, bins + 1)
+
+
+def _bin_sums(cum, cut):
+    # Totals between consecutive edges from a cumulative sum
+    cum = np.concatenate(([0.0], cum))
+    return cum[cut[1:]] - cum[cut[:-1]]
+
+
+def _profile(pos, vel, mass, edges, log, fractions):
+    r = np.sqrt((pos**2).sum(axis=0))
+    order = np.argsort(r)
+    r = r[order]
+    mass = mass[order]
+    cut = np.searchsorted(r, edges, side='right')
+    cmass = np.cumsum(mass)
+    total = cmass[-1] if len(cmass) else 0.0
+    enclosed = np.concatenate(([0.0], cmass))[cut]
+    shell = np.diff(enclosed)
+    prof = dict(edges=edges, r=np.sqrt(edges[1:]*edges[:-1]) if log
+                else 0.5*(edges[1:] + edges[:-1]),
+                count=np.diff(cut), mass=shell, enclosed=enclosed,
+                density=shell/(4.0/3.0*np.pi*np.diff(edges**3)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        prof['vcirc'] = np.sqrt(G*enclosed/edges)
+        prof['lagrangian'] = np.array(
+            [r[min(np.searchsorted(cmass, f*total), len(r) - 1)]
+             if len(r) else np.nan for f in fractions])
+        if vel is not None:
+            vel = vel[:, order]
+            rhat = pos[:, order]/np.where(r > 0, r, 1.0)
+            vr = (vel*rhat).sum(axis=0)
+            n = prof['count']
+            var = 0.0
+            for v in vel:
+                mean = _bin_sums(np.cumsum(v), cut)/n
+                var = var + _bin_sums(np.cumsum(v*v), cut)/n - mean**2
+            prof['sigma'] = np.sqrt(np.maximum(var/3.0, 0.0))
+            mean = _bin_sums(np.cumsum(vr), cut)/n
+            prof['sigma_r'] = np.sqrt(np.maximum(
+                _bin_sums(np.cumsum(vr*vr), cut)/n - mean**2, 0.0))
+            prof['vr'] = mean
+    return prof
+
+
+def profiles(snap, centre=(0.0, 0.0, 0.0), bins=50, rmin=None, rmax=None,
+             log=True, components=None, fractions=lagrangian_fractions):
+    """
+    Radial profiles around centre (in the Snapshot's frame) of every
+    component, or of those given by name or index, plus 'all' for
+    their sum. bins is a number of log or linear bins between rmin and
+    rmax (the data range by default) or an array of edges.
+
+    Each profile is a dict with the bin edges and centres r, count,
+    shell mass, enclosed mass and circular velocity at the edges,
+    density, the 1D and radial velocity dispersions sigma and sigma_r
+    and mean radial velocity vr when velocities were read, and the
+    radii enclosing the given mass fractions (lagrangian).
+    """
+    centre = np.asarray(centre, dtype='f8')
+    if components is None:
+        components = range(len(snap.names))
+    comps = [snap.index(c) for c in components]
+    has_v = all(q in snap.data for q in ('vx', 'vy', 'vz'))
+    parts = []
+    for i in comps:
+        pos = np.array([snap.component(i, q) for q in 'xyz'], dtype='f8')
+        pos -= centre[:, None]
+        vel = (np.array([snap.component(i, q) for q in ('vx', 'vy', 'vz')],
+                        dtype='f8') if has_v else None)
+        parts.append((pos, vel, np.full(pos.shape[1], snap.masses[i])))
+    pos, vel, mass = [np.concatenate(p, axis=-1) if p[0] is not None
+                      else None for p in zip(*parts)]
+    # Common edges so that the component profiles can be compared
+    edges = _edges(np.sqrt((pos**2).sum(axis=0)), bins, rmin, rmax, log)
+    out = dict((snap.names[i], _profile(*part, edges, log, fractions))
+               for i, part in zip(comps, parts))
+    out['all'] = _profile(pos, vel, mass, edges, log, fractions)
+    return out
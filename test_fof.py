@@ -0,0 +1,66 @@
+"""
+fof must find the same groups as a brute-force friends-of-friends.
+"""
+import numpy as np
+
+from fof import fof
+
+
+def brute_force(pos, b):
+    linked = ((pos[:, :, None] - pos[:, None, :])**2).sum(axis=0) <= b*b
+    label = np.full(pos.shape[1], -1)
+    for seed in range(pos.shape[1]):
+        if label[seed] >= 0:
+            continue
+        label[seed] = seed
+        stack = [seed]
+        while stack:
+            k = stack.pop()
+            new = np.flatnonzero(linked[k] & (label < 0))
+            label[new] = seed
+            stack.extend(new)
+    return label
+
+
+def same_partition(a, b):
+    pairs = set(zip(a.tolist(), b.tolist()))
+    return len(pairs) == len(set(a.tolist())) == len(set(b.tolist()))
+
+
+def test_fof_matches_brute_force():
+    rng = np.random.default_rng(3)
+    pos = np.concatenate([rng.uniform(0, 10, (3, 800)),
+                          rng.normal(size=(3, 300))*0.3 + 3,
+                          rng.normal(size=(3, 150))*0.2 + 7], axis=1)
+    b = 0.25
+    out = fof(pos, b, min_size=1, chunk=5000)
+    assert same_partition(out['group'], brute_force(pos, b))
+    assert out['size'].sum() == pos.shape[1]
+    assert np.all(np.diff(out['size']) <= 0)
+
+
+def test_fof_groups_and_centres():
+    rng = np.random.default_rng(4)
+    pos = np.concatenate([rng.normal(size=(3, 200))*0.1 + 2,
+                          rng.normal(size=(3, 100))*0.1 - 2,
+                          rng.uniform(-20, 20, (3, 50))], axis=1)
+    mass = rng.uniform(1, 2, pos.shape[1])
+    out = fof(pos, 0.2, mass=mass, min_size=20)
+    assert len(out['size']) == 2
+    for g, start, stop in ((0, 0, 200), (1, 200, 300)):
+        members = out['group'] == g
+        assert np.array_equal(np.flatnonzero(members)[[0, -1]],
+                              [start, stop - 1])
+        m = mass[members]
+        np.testing.assert_allclose(out['centre'][:, g],
+                                   (pos[:, members]*m).sum(axis=1)/m.sum())
+        np.testing.assert_allclose(out['mass'][g], m.sum())
+
+
+def test_fof_chain():
+    # A filament longer than any single union pass
+    n = 20000
+    pos = np.zeros((3, n))
+    pos[0] = np.arange(n)*0.9
+    out = fof(pos, 1.0, chunk=1000)
+    assert np.array_equal(out['size'], [n])
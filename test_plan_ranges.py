@@ -0,0 +1,40 @@
+"""
+plan_ranges must give the same (seek, count) layout as get_ranges.
+"""
+import numpy as np
+import pytest
+
+from READ_ART import get_ranges, plan_ranges
+
+np_per_page = 64
+num_pages = 5
+
+cases = [
+    (0, 1),                                 # one particle
+    (10, 20),                               # inside one page
+    (10, np_per_page),                      # partial first and last page
+    (37, 3*np_per_page),                    # partial ends, full middle
+    (0, np_per_page),                       # exactly one page
+    (np_per_page, 2*np_per_page),           # starts and ends on boundaries
+    (np_per_page - 1, 2),                   # straddles a boundary
+    (2*np_per_page, 0),                     # count == 0
+    (0, num_pages*np_per_page),             # whole file
+]
+
+
+@pytest.mark.parametrize('skip,count', cases)
+@pytest.mark.parametrize('field', [0, 3, 5, 'x', 'vy', 'vz'])
+def test_plan_ranges_matches_get_ranges(skip, count, field):
+    kwargs = dict(np_per_page=np_per_page, num_pages=num_pages)
+    expected = np.array(get_ranges(skip, count, field, **kwargs),
+                        dtype='i8').reshape(-1, 2)
+    plan, = plan_ranges(skip, count, [field], **kwargs)
+    np.testing.assert_array_equal(plan, expected)
+
+
+def test_plan_ranges_several_fields():
+    kwargs = dict(np_per_page=np_per_page, num_pages=num_pages)
+    plans = plan_ranges(37, 3*np_per_page, ['x', 4, 'vz'], **kwargs)
+    for field, plan in zip(['x', 4, 'vz'], plans):
+        expected = np.array(get_ranges(37, 3*np_per_page, field, **kwargs))
+        np.testing.assert_array_equal(plan, expected)
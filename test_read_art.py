@@ -0,0 +1,123 @@
+"""
+read_ART against arrays computed directly from a small synthetic
+PMcrd/PMcrs0 pair, written in both byte orders.
+"""
+import numpy as np
+import pytest
+
+from READ_ART import read_ART, particle_words
+
+Nrow = 8
+ng = 8
+lspecies = (150, 300, 340)
+nstars = 50
+aexpn, hubble, boxsize, Md = 0.685, 0.7, 100.0, 1e10
+
+
+def write_snapshot(path, endian):
+    """
+    Write the PMcrd header and the PMcrs0 pages, returning the file name
+    and the (6, N) particle words as stored, promoted to float64.
+    """
+    f4, i4 = endian+'f4', endian+'i4'
+    ns = len(lspecies)
+    wspecies = np.zeros(10, f4)
+    wspecies[:ns] = 2.0**np.arange(ns)
+    ls = np.zeros(10, i4)
+    ls[:ns] = lspecies
+    body = b''.join([
+        b'synthetic header'.ljust(45),
+        np.array([aexpn, 0.1, 1.0, 0.01], f4).tobytes(),
+        np.array([123], i4).tobytes(),
+        np.array([1.0, 2.0, 10.0, 11.0, 12.0, 0.5, 0.6], f4).tobytes(),
+        np.array([Nrow, ng, ns, 7], i4).tobytes(),
+        np.array([0.3, 0.7, hubble, 0.0, 0.0], f4).tobytes(),
+        wspecies.tobytes(), ls.tobytes(),
+        np.zeros(71, f4).tobytes(),
+        np.array([3.0, Md], f4).tobytes(),
+        np.zeros(6, f4).tobytes(),
+        np.array([boxsize], f4).tobytes()])
+    mark = np.array([len(body)], i4).tobytes()
+    (path / 'PMcrda0.6850.DAT').write_bytes(mark + body + mark)
+    rng = np.random.default_rng(0)
+    npp = Nrow**2
+    npages = -(-lspecies[-1]//npp)
+    words = np.concatenate([rng.uniform(1, ng + 1, (3, npages*npp)),
+                            rng.normal(size=(3, npages*npp))])
+    words = words.astype('f4')
+    pages = words.reshape(6, npages, npp).transpose(1, 0, 2)
+    pages.astype(f4).tofile(str(path / 'PMcrs0a0.6850.DAT'))
+    return 'PMcrs0a0.6850.DAT', words[:, :lspecies[-1]].astype('f8')
+
+
+def expected(words):
+    """
+    Components, masses and physical columns the way read_ART defines
+    them: stars are the first nstars particles, particle nstars is
+    skipped and everything is centred on the mean stellar position.
+    """
+    u = words[:3]/ng - 1.0/ng
+    centre = u[:, :nstars].mean(axis=1)
+    scaleC = aexpn/hubble*1000.
+    scaleV = boxsize*100/ng
+    scaleM = Md/nstars/hubble
+    columns = dict(zip(particle_words,
+                       list((u - centre[:, None])*scaleC)
+                       + list(words[3:]*scaleV)))
+    edges = (0,) + lspecies
+    comps = [('stars', 0, nstars, scaleM),
+             ('specie0', nstars + 1, edges[1], scaleM)]
+    comps += [('specie%i' % i, edges[i], edges[i+1], scaleM*2**i)
+              for i in range(1, len(lspecies))]
+    return comps, columns, centre
+
+
+@pytest.fixture(params=['<', '>'], ids=['little', 'big'])
+def snapshot(request, tmp_path):
+    filename, words = write_snapshot(tmp_path, request.param)
+    return str(tmp_path) + '/', filename, words
+
+
+def check(snap, comps, columns, fields, rtol):
+    # The unit constants come from float32 header words, hence rtol
+    assert snap.names == [name for name, a, b, m in comps]
+    np.testing.assert_array_equal(snap.sizes,
+                                  [b - a for name, a, b, m in comps])
+    np.testing.assert_allclose(snap.masses, [m for name, a, b, m in comps],
+                               rtol=1e-6)
+    for name, a, b, m in comps:
+        np.testing.assert_array_equal(snap.component(name, 'Id'),
+                                      np.arange(a, b))
+        for f in fields:
+            np.testing.assert_allclose(snap.component(name, f),
+                                       columns[f][a:b], rtol=rtol,
+                                       atol=rtol*np.abs(columns[f]).max())
+    for f in particle_words:
+        assert (f in snap.data) == (f in fields)
+
+
+def test_full_read(snapshot):
+    path, filename, words = snapshot
+    comps, columns, centre = expected(words)
+    snap = read_ART(path, filename, nstars)
+    check(snap, comps, columns, particle_words, 1e-6)
+    np.testing.assert_allclose(snap.centre, centre, rtol=1e-12)
+    mass, x, y, z, vx, vy, vz, Id = snap
+    assert len(x) == len(comps)
+    np.testing.assert_array_equal(Id[1], np.arange(nstars + 1, lspecies[0]))
+
+
+def test_selection(snapshot):
+    path, filename, words = snapshot
+    comps, columns, centre = expected(words)
+    snap = read_ART(path, filename, nstars, species=['specie1', 'stars'],
+                    fields=['vz', 'x'])
+    check(snap, [comps[0], comps[2]], columns, ['x', 'vz'], 1e-6)
+
+
+def test_float32(snapshot):
+    path, filename, words = snapshot
+    comps, columns, centre = expected(words)
+    snap = read_ART(path, filename, nstars, dtype='f4')
+    assert snap.dtype == np.dtype('f4')
+    check(snap, comps, columns, particle_words, 1e-5)